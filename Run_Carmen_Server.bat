@@ -0,0 +1,21 @@
+@echo off
+title Carmen - Headless Server (HTTP + WebSocket)
+cd /d %~dp0
+
+:: Hide GPUs to silence CUDA DLL probes
+set CUDA_VISIBLE_DEVICES=
+
+:: Ensure venv
+if not exist venv (
+    python -m venv venv
+)
+call venv\Scripts\activate.bat
+
+:: Deps used by the server (the server itself is standard library only)
+python -m pip install --upgrade pip
+pip install numpy gpt4all edge-tts
+
+:: Run the server; extra arguments pass through, e.g. --port 9000 or --backend echo
+python carmen_server.py %*
+
+pause
@@ -1,21 +1,23 @@
 import tkinter as tk
 from tkinter import scrolledtext
-import json
 import os
+from ui_utils import trim_text_widget
+from config_manager import COMPANION_SCHEMA, get_config
 
 CONFIG_PATH = os.path.join("config", "companion_config.json")
 
 def load_config():
-    try:
-        with open(CONFIG_PATH, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return {
+    # Shared, validated and hot-reloaded; defaults fill anything missing
+    return get_config(
+        CONFIG_PATH,
+        defaults={
             "name": "Carmen",
             "emoji": "💠",
             "mood": "Default",
             "theme": "Dark"
-        }
+        },
+        schema=COMPANION_SCHEMA
+    )
 
 class CompanionApp:
     def __init__(self, root):
@@ -57,6 +59,7 @@ class CompanionApp:
         # Basic echo bot for now
         bot_reply = f"{self.config['name']}: I heard '{user_text}'"
         self.chat_display.insert(tk.END, bot_reply + "\n")
+        trim_text_widget(self.chat_display, self.config.get("scrollback_lines", 1000))
 
 def run_app():
     root = tk.Tk()
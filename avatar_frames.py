@@ -0,0 +1,524 @@
+"""
+Avatar video utilities for Local AI Companion
+Decodes each mood clip once at display size and replays it from memory
+"""
+
+import collections
+import hashlib
+import json
+import logging
+import os
+import struct
+import threading
+import time
+
+import cv2
+import numpy as np
+from PIL import Image, ImageTk
+
+# Default bound on one decoded clip (the frame cache passes its own cap instead)
+MAX_DECODE_BYTES = 512 * 1024 * 1024
+
+# Sprite atlas file layout: magic, u32 header length, JSON header,
+# 256x3 RGB palette, then frame indices (count x height x width, uint8)
+# starting at a 64-byte aligned offset so they can be memory-mapped.
+ATLAS_MAGIC = b"CARMENATLAS1"
+ATLAS_EXTENSION = ".atlas"
+ATLAS_ALIGN = 64
+
+
+class AvatarClip:
+    """Pre-decoded RGB frames of one clip at display size"""
+
+    def __init__(self, path, frames, fps):
+        self.path = path
+        self.frames = frames  # uint8 array shaped (count, height, width, 3), RGB
+        self.fps = fps if fps and fps > 1 else 30.0
+
+    def __len__(self):
+        return len(self.frames)
+
+    @property
+    def nbytes(self):
+        return int(self.frames.nbytes)
+
+
+class AtlasFrames:
+    """Palette-indexed frames read from a memory-mapped sprite atlas
+
+    Indexing returns an RGB frame, so it can stand in for a decoded
+    frame array anywhere an AvatarClip is played.
+    """
+
+    def __init__(self, indices, palette):
+        self.indices = indices  # memmap shaped (count, height, width)
+        self.palette = palette  # (256, 3) uint8 RGB
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, index):
+        return self.palette[self.indices[index]]
+
+    @property
+    def shape(self):
+        return self.indices.shape + (3,)
+
+    @property
+    def nbytes(self):
+        return int(self.indices.nbytes + self.palette.nbytes)
+
+
+def atlas_path_for(path):
+    return os.path.splitext(path)[0] + ATLAS_EXTENSION
+
+
+def clip_available(path):
+    """True if a clip exists as a video or as a prebuilt sprite atlas"""
+    return bool(path) and (os.path.exists(path) or os.path.exists(atlas_path_for(path)))
+
+
+def write_atlas(frames, fps, atlas_path, colors=256, sample_frames=16):
+    """Quantize RGB frames to one shared palette and write a sprite atlas file"""
+    count, height, width = frames.shape[:3]
+    # Build one palette from a strip of evenly spaced sample frames
+    step = max(1, count // sample_frames)
+    samples = np.concatenate([frames[i] for i in range(0, count, step)], axis=0)
+    palette_image = Image.fromarray(samples).quantize(colors=colors, method=Image.Quantize.MEDIANCUT)
+    palette = np.array(palette_image.getpalette()[:colors * 3], dtype=np.uint8).reshape(-1, 3)
+    palette = np.pad(palette, ((0, 256 - len(palette)), (0, 0)))
+
+    header = json.dumps({
+        "frames": count, "width": width, "height": height, "fps": fps, "colors": colors
+    }).encode("utf-8")
+    prefix = len(ATLAS_MAGIC) + 4 + len(header) + palette.nbytes
+    padding = (-prefix) % ATLAS_ALIGN
+
+    temp_path = atlas_path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(ATLAS_MAGIC)
+        f.write(struct.pack("<I", len(header)))
+        f.write(header)
+        f.write(palette.tobytes())
+        f.write(bytes(padding))
+        for frame in frames:
+            indexed = Image.fromarray(frame).quantize(palette=palette_image, dither=Image.Dither.NONE)
+            f.write(np.asarray(indexed, dtype=np.uint8).tobytes())
+    os.replace(temp_path, atlas_path)
+    return atlas_path
+
+
+def load_atlas(atlas_path):
+    """Memory-map a sprite atlas, returning (AtlasFrames, fps)"""
+    with open(atlas_path, "rb") as f:
+        if f.read(len(ATLAS_MAGIC)) != ATLAS_MAGIC:
+            raise ValueError(f"Not an avatar atlas: {atlas_path}")
+        (header_len,) = struct.unpack("<I", f.read(4))
+        header = json.loads(f.read(header_len).decode("utf-8"))
+        palette = np.frombuffer(f.read(256 * 3), dtype=np.uint8).reshape(256, 3)
+    prefix = len(ATLAS_MAGIC) + 4 + header_len + palette.nbytes
+    offset = prefix + (-prefix) % ATLAS_ALIGN
+    indices = np.memmap(atlas_path, dtype=np.uint8, mode="r", offset=offset,
+                        shape=(header["frames"], header["height"], header["width"]))
+    return AtlasFrames(indices, palette), header["fps"]
+
+
+def _open_capture(path):
+    # carmen_safevideo_micfix swaps cv2.VideoCapture for a lossy async reader;
+    # decoding a clip into the cache needs every frame, so use the real one.
+    factory = getattr(cv2.VideoCapture, "unpatched", cv2.VideoCapture)
+    return factory(path)
+
+
+def decode_clip(path, size, max_bytes=MAX_DECODE_BYTES):
+    """Decode a clip, resized to ``size`` (width, height) and converted to RGB
+
+    Frames are written straight into one preallocated array, and decoding
+    stops once ``max_bytes`` of frames have been produced.
+    """
+    width, height = size
+    limit = max(1, max_bytes // (width * height * 3))
+    cap = _open_capture(path)
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        # An unreported count grows the buffer by doubling, still within the byte limit
+        capacity = min(total, limit) if total > 0 else min(64, limit)
+        frames = np.empty((capacity, height, width, 3), dtype=np.uint8)
+        count = 0
+        while count < limit:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if count == len(frames):
+                grown = np.empty((min(len(frames) * 2, limit), height, width, 3), dtype=np.uint8)
+                grown[:count] = frames[:count]
+                frames = grown
+            resized = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+            cv2.cvtColor(resized, cv2.COLOR_BGR2RGB, dst=frames[count])
+            count += 1
+    finally:
+        cap.release()
+
+    if count >= limit and (total <= 0 or total > limit):
+        logging.getLogger(__name__).warning(
+            f"Avatar clip {path} truncated to {count} frames to stay within {max_bytes} bytes"
+        )
+    # The container's count can overstate what decodes; don't keep the unused tail
+    return (frames if count == len(frames) else frames[:count].copy()), fps
+
+
+class AvatarFrameCache:
+    """LRU cache of decoded avatar clips with a memory cap
+
+    With ``disk_dir`` set, decoded clips are also written there as ``.npy``
+    files and loaded back memory-mapped, so a clip is only ever decoded once
+    per source file and resolution.
+    """
+
+    def __init__(self, size=(512, 750), max_bytes=512 * 1024 * 1024, disk_dir=None):
+        self.size = size
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.logger = logging.getLogger(__name__)
+        self._clips = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._decode_locks = {}
+
+    def get(self, path):
+        """Return the cached clip for ``path``, decoding it on first use"""
+        with self._lock:
+            clip = self._clips.get(path)
+            if clip is not None:
+                self._clips.move_to_end(path)
+                return clip
+            decode_lock = self._decode_locks.setdefault(path, threading.Lock())
+
+        # Decode outside the cache lock so other moods stay available meanwhile
+        with decode_lock:
+            with self._lock:
+                clip = self._clips.get(path)
+            if clip is None:
+                clip = self._load(path)
+                with self._lock:
+                    self._clips[path] = clip
+                    self._clips.move_to_end(path)
+                    self._evict(keep=path)
+        return clip
+
+    def contains(self, path):
+        with self._lock:
+            return path in self._clips
+
+    def total_bytes(self):
+        with self._lock:
+            return sum(clip.nbytes for clip in self._clips.values())
+
+    def has_room(self):
+        """True if one more clip of the largest size seen so far fits under the cap"""
+        with self._lock:
+            sizes = [clip.nbytes for clip in self._clips.values()]
+        return sum(sizes) + max(sizes, default=0) <= self.max_bytes
+
+    def clear(self):
+        with self._lock:
+            self._clips.clear()
+
+    def _evict(self, keep):
+        total = sum(clip.nbytes for clip in self._clips.values())
+        for path in list(self._clips):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            total -= self._clips.pop(path).nbytes
+            self.logger.info(f"Evicted avatar clip from cache: {path}")
+        if total > self.max_bytes:
+            self.logger.warning(f"Avatar clip {keep} alone exceeds the cache cap of {self.max_bytes} bytes")
+
+    def _disk_path(self, path):
+        stat = os.stat(path)
+        key = f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}|{self.size[0]}x{self.size[1]}"
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+        name = os.path.splitext(os.path.basename(path))[0]
+        return os.path.join(self.disk_dir, f"{name}_{self.size[0]}x{self.size[1]}_{digest}.npy")
+
+    def _load(self, path):
+        atlas = self._load_atlas(path)
+        if atlas is not None:
+            return atlas
+
+        disk_path = self._disk_path(path) if self.disk_dir else None
+        fps_path = disk_path + ".fps" if disk_path else None
+
+        if disk_path and os.path.exists(disk_path) and os.path.exists(fps_path):
+            try:
+                with open(fps_path, "r", encoding="utf-8") as f:
+                    fps = float(f.read().strip() or 30.0)
+                return AvatarClip(path, np.load(disk_path, mmap_mode="r"), fps)
+            except Exception as e:
+                self.logger.error(f"Error loading cached avatar frames {disk_path}: {e}")
+
+        frames, fps = decode_clip(path, self.size, max_bytes=self.max_bytes)
+        self.logger.info(f"Decoded avatar clip {path}: {len(frames)} frames at {fps:.1f} fps")
+
+        if disk_path and len(frames):
+            try:
+                os.makedirs(self.disk_dir, exist_ok=True)
+                temp_path = disk_path + ".tmp"
+                with open(temp_path, "wb") as f:
+                    np.save(f, frames)
+                os.replace(temp_path, disk_path)
+                with open(fps_path, "w", encoding="utf-8") as f:
+                    f.write(str(fps))
+                frames = np.load(disk_path, mmap_mode="r")
+            except Exception as e:
+                self.logger.error(f"Error writing avatar frame cache {disk_path}: {e}")
+
+        return AvatarClip(path, frames, fps)
+
+    def _load_atlas(self, path):
+        """Use a prebuilt sprite atlas when it matches the display size and is not stale"""
+        atlas_path = atlas_path_for(path)
+        if not os.path.exists(atlas_path):
+            return None
+        if os.path.exists(path) and os.path.getmtime(path) > os.path.getmtime(atlas_path):
+            self.logger.info(f"Avatar atlas {atlas_path} is older than its clip, decoding video instead")
+            return None
+        try:
+            frames, fps = load_atlas(atlas_path)
+        except Exception as e:
+            self.logger.error(f"Error loading avatar atlas {atlas_path}: {e}")
+            return None
+        if frames.shape[1:3] != (self.size[1], self.size[0]):
+            self.logger.info(f"Avatar atlas {atlas_path} is {frames.shape[2]}x{frames.shape[1]}, expected "
+                             f"{self.size[0]}x{self.size[1]}; decoding video instead")
+            return None
+        return AvatarClip(path, frames, fps)
+
+
+class AvatarClipLoader:
+    """One persistent worker thread that decodes clips into the cache
+
+    ``switch`` requests always win over background prefetches; if several
+    switches arrive while a clip is decoding, only the latest is delivered.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.logger = logging.getLogger(__name__)
+        self._cond = threading.Condition()
+        self._switch = None
+        self._prefetch = collections.deque()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="avatar-loader", daemon=True)
+        self._thread.start()
+
+    def switch(self, path, on_ready):
+        """Load ``path`` and call ``on_ready(clip)`` from the worker thread"""
+        with self._cond:
+            self._switch = (path, on_ready)
+            self._cond.notify()
+
+    def prefetch(self, paths):
+        """Queue clips to decode in the background while the cache has room"""
+        with self._cond:
+            for path in paths:
+                if path not in self._prefetch:
+                    self._prefetch.append(path)
+            self._cond.notify()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._switch = None
+            self._prefetch.clear()
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and self._switch is None and not self._prefetch:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                if self._switch is not None:
+                    job, on_ready = self._switch
+                    self._switch = None
+                else:
+                    job, on_ready = self._prefetch.popleft(), None
+            try:
+                if on_ready is None:
+                    if self.cache.contains(job) or not clip_available(job) or not self.cache.has_room():
+                        continue
+                clip = self.cache.get(job)
+            except Exception as e:
+                self.logger.error(f"Error loading avatar clip {job}: {e}")
+                continue
+            if on_ready is not None:
+                with self._cond:
+                    superseded = self._switch is not None
+                if not superseded:
+                    on_ready(clip)
+
+
+class AvatarRenderer:
+    """Plays an AvatarClip into a Tk label from the Tk event loop
+
+    Frame times come from a monotonic clock at the clip's native FPS. Only
+    one ``after`` callback is ever pending; when the loop falls behind,
+    late frames are skipped and counted as dropped. Playback is suspended
+    while the window is minimized or the avatar is hidden. Switching clips
+    crossfades from the old clip over ``crossfade`` seconds.
+    """
+
+    def __init__(self, root, label, crossfade=0.4):
+        self.root = root
+        self.label = label
+        self.clip = None
+        self.crossfade = crossfade
+        self.visible = True
+        self.minimized = False
+        self.frames_rendered = 0
+        self.frames_dropped = 0
+        self._photo = None
+        self._after_id = None
+        self._start = 0.0
+        self._last_index = -1
+        self._position = 0
+        self._fade_clip = None
+        self._fade_start = 0.0
+        self._fade_clip_start = 0.0
+        self._fps_window = collections.deque(maxlen=60)
+        self.root.bind("<Unmap>", self._on_unmap, add="+")
+        self.root.bind("<Map>", self._on_map, add="+")
+        self._bind_label()
+
+    def set_label(self, label):
+        """Point the renderer at a new label (e.g. after the GUI is rebuilt)"""
+        self.label = label
+        self._photo = None
+        self._bind_label()
+        self._restart()
+
+    def _bind_label(self):
+        if self.label is not None:
+            # Hiding the avatar (grid_remove/pack_forget) unmaps the label
+            self.label.bind("<Unmap>", lambda event: self.set_visible(False), add="+")
+            self.label.bind("<Map>", lambda event: self.set_visible(True), add="+")
+
+    def play(self, clip):
+        old = self.clip
+        self._fade_clip = None
+        if old is not None and old is not clip and len(old) and self.crossfade > 0 \
+                and old.frames.shape[1:] == clip.frames.shape[1:]:
+            # Keep the outgoing clip running on its own clock while fading out
+            self._fade_clip = old
+            self._fade_clip_start = self._start
+            self._fade_start = time.monotonic()
+        self.clip = clip
+        self._position = 0
+        self._last_index = -1
+        self._restart()
+
+    def stop(self):
+        self._cancel()
+        self.clip = None
+        self._fade_clip = None
+
+    def set_visible(self, visible):
+        self.visible = visible
+        self._restart()
+
+    def is_paused(self):
+        return self.minimized or not self.visible
+
+    def stats(self):
+        """Current measured FPS plus rendered/dropped frame counters"""
+        fps = 0.0
+        if len(self._fps_window) > 1:
+            span = self._fps_window[-1] - self._fps_window[0]
+            if span > 0:
+                fps = (len(self._fps_window) - 1) / span
+        return {
+            "fps": fps,
+            "target_fps": self.clip.fps if self.clip else 0.0,
+            "rendered": self.frames_rendered,
+            "dropped": self.frames_dropped,
+            "paused": self.is_paused(),
+        }
+
+    def _on_unmap(self, event):
+        if event.widget is self.root:
+            self.minimized = True
+            self._cancel()
+
+    def _on_map(self, event):
+        if event.widget is self.root and self.minimized:
+            self.minimized = False
+            self._restart()
+
+    def _cancel(self):
+        if self._after_id is not None:
+            try:
+                self.root.after_cancel(self._after_id)
+            except Exception:
+                pass
+            self._after_id = None
+        if self._last_index >= 0:
+            self._position = self._last_index + 1
+
+    def _restart(self):
+        self._cancel()
+        if self.clip is None or not len(self.clip) or self.is_paused():
+            return
+        # Resume from the current position rather than catching up on paused time
+        self._start = time.monotonic() - self._position / self.clip.fps
+        self._last_index = self._position - 1
+        self._fps_window.clear()
+        self._after_id = self.root.after(0, self._tick)
+
+    def _tick(self):
+        self._after_id = None
+        clip = self.clip
+        if clip is None or not len(clip) or self.is_paused():
+            return
+
+        now = time.monotonic()
+        index = int((now - self._start) * clip.fps)
+        if index <= self._last_index:
+            index = self._last_index + 1
+        elif index > self._last_index + 1:
+            self.frames_dropped += index - self._last_index - 1
+        self._last_index = index
+
+        frame = clip.frames[index % len(clip)]
+        if self._fade_clip is not None:
+            frame = self._blend(frame, now)
+        self._show(frame)
+        self.frames_rendered += 1
+        self._fps_window.append(now)
+
+        next_due = self._start + (index + 1) / clip.fps
+        delay = max(1, int((next_due - time.monotonic()) * 1000))
+        self._after_id = self.root.after(delay, self._tick)
+
+    def _blend(self, frame, now):
+        alpha = (now - self._fade_start) / self.crossfade
+        if alpha >= 1.0:
+            self._fade_clip = None
+            return frame
+        old = self._fade_clip
+        old_index = int((now - self._fade_clip_start) * old.fps) % len(old)
+        return cv2.addWeighted(old.frames[old_index], 1.0 - alpha, frame, alpha, 0)
+
+    def _show(self, frame):
+        if self.label is None:
+            return
+        img = Image.fromarray(frame)
+        if self._photo is None or self._photo.width() != img.width or self._photo.height() != img.height:
+            self._photo = ImageTk.PhotoImage(img)
+            self.label.configure(image=self._photo)
+            self.label.image = self._photo
+        else:
+            self._photo.paste(img)
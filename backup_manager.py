@@ -3,80 +3,564 @@ Backup and restore utilities for Local AI Companion
 """
 
 import os
+import io
+import collections
 import json
+import gzip
+import hashlib
 import shutil
+import tarfile
+import tempfile
+import threading
+import time
 import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import logging
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CHUNK_SIZE = 1024 * 1024  # fixed-size chunks keep appends to logs cheap to back up
+BLOCK_SIZE = 4 * 1024 * 1024  # unit of parallel compression in full backups
+CHECKSUM_HEADER = "CARMEN.sha256"
+SIZE_HEADER = "CARMEN.size"
+MANIFEST_NAME = "MANIFEST.json"
+CATALOGUE_NAME = "catalogue.json"
+DEFAULT_RETENTION = {"hourly": 24, "daily": 7, "weekly": 4}
+
+
+def _compress_block(data, codec):
+    # zlib and zstandard release the GIL, so blocks compress in parallel on threads
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return gzip.compress(data, 6)
+
+
+def _open_decompressed(fileobj, name):
+    if name.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError("zstandard is needed to restore this backup")
+        return zstandard.ZstdDecompressor().stream_reader(fileobj, read_across_frames=True)
+    if name.endswith(".gz"):
+        return gzip.GzipFile(fileobj=fileobj)
+    return fileobj
+
+
 class BackupManager:
     def __init__(self, project_root):
         self.project_root = project_root
         self.backup_dir = os.path.join(project_root, "data", "backups")
+        self.chunk_dir = os.path.join(self.backup_dir, "chunks")
+        self.snapshot_dir = os.path.join(self.backup_dir, "snapshots")
         self.logger = logging.getLogger(__name__)
-    
-    def create_full_backup(self):
-        """Create a full backup of all user data"""
+        self.catalogue_path = os.path.join(self.backup_dir, CATALOGUE_NAME)
+        self._backup_lock = threading.Lock()
+        self._catalogue_lock = threading.Lock()
+        self._catalogue = None
+
+    def _iter_backup_files(self):
+        """Yield (file_path, arc_path) for everything under config/ and data/"""
+        for folder in ("config", "data"):
+            for root, dirs, files in os.walk(os.path.join(self.project_root, folder)):
+                # Skip backup directory to avoid recursion
+                dirs[:] = [d for d in dirs
+                           if os.path.abspath(os.path.join(root, d)) != os.path.abspath(self.backup_dir)]
+                for file in files:
+                    file_path = os.path.join(root, file)
+                    yield file_path, os.path.relpath(file_path, self.project_root)
+
+    def create_full_backup(self, progress=None, workers=None):
+        """Create a full backup of all user data
+
+        Files are read in blocks that a thread pool compresses in parallel
+        (zstd when installed, else gzip), spooled to a temporary file and
+        added to a tar archive.
+        Each entry carries the SHA-256 and size of the original file in its
+        pax header, and a MANIFEST.json listing them closes the archive.
+        ``progress(done_bytes, total_bytes, bytes_per_second)`` is called as
+        files complete.
+        """
+        if not self._backup_lock.acquire(blocking=False):
+            self.logger.warning("A backup is already running")
+            return None
+        codec = "zstd" if zstandard is not None else "gzip"
+        suffix = ".zst" if codec == "zstd" else ".gz"
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        backup_name = f"full_backup_{timestamp}.tar"
+        backup_path = os.path.join(self.backup_dir, backup_name)
         try:
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            backup_name = f"full_backup_{timestamp}.zip"
-            backup_path = os.path.join(self.backup_dir, backup_name)
-            
-            with zipfile.ZipFile(backup_path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                # Backup config
-                config_dir = os.path.join(self.project_root, "config")
-                for root, dirs, files in os.walk(config_dir):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        arc_path = os.path.relpath(file_path, self.project_root)
-                        zip_file.write(file_path, arc_path)
-                
-                # Backup data
-                data_dir = os.path.join(self.project_root, "data")
-                for root, dirs, files in os.walk(data_dir):
-                    # Skip backup directory to avoid recursion
-                    if "backups" in root:
-                        continue
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        arc_path = os.path.relpath(file_path, self.project_root)
-                        zip_file.write(file_path, arc_path)
-            
-            self.logger.info(f"Full backup created: {backup_path}")
+            os.makedirs(self.backup_dir, exist_ok=True)
+            files = [(path, arc, os.path.getsize(path)) for path, arc in self._iter_backup_files()]
+            total = sum(size for _, _, size in files)
+            workers = workers or min(8, os.cpu_count() or 2)
+            manifest = {"created": datetime.now().isoformat(), "codec": codec, "files": {}}
+            started = time.monotonic()
+            done = 0
+
+            with ThreadPoolExecutor(max_workers=workers) as pool, \
+                    tarfile.open(backup_path + ".tmp", "w", format=tarfile.PAX_FORMAT) as tar:
+                for file_path, arc_path, _ in files:
+                    digest = hashlib.sha256()
+                    size = 0
+                    # Compressed blocks go to a spool file in order as they finish, so at
+                    # most two blocks per worker are held in memory whatever the file size
+                    with open(file_path, 'rb') as f, \
+                            tempfile.TemporaryFile(dir=self.backup_dir) as spool:
+                        futures = collections.deque()
+                        for block in iter(lambda: f.read(BLOCK_SIZE), b""):
+                            digest.update(block)
+                            size += len(block)
+                            futures.append(pool.submit(_compress_block, block, codec))
+                            if len(futures) >= workers * 2:
+                                spool.write(futures.popleft().result())
+                        while futures:
+                            spool.write(futures.popleft().result())
+
+                        arc_path = arc_path.replace(os.sep, "/")
+                        info = tarfile.TarInfo(arc_path + suffix)
+                        info.size = spool.tell()
+                        info.mtime = int(os.path.getmtime(file_path))
+                        info.pax_headers = {CHECKSUM_HEADER: digest.hexdigest(), SIZE_HEADER: str(size)}
+                        spool.seek(0)
+                        tar.addfile(info, spool)
+                    manifest["files"][arc_path] = {"sha256": digest.hexdigest(), "size": size,
+                                                   "compressed": info.size}
+
+                    done += size
+                    if progress:
+                        elapsed = max(time.monotonic() - started, 1e-6)
+                        progress(done, total, done / elapsed)
+
+                data = json.dumps(manifest, indent=2).encode("utf-8")
+                info = tarfile.TarInfo(MANIFEST_NAME)
+                info.size = len(data)
+                info.mtime = int(time.time())
+                tar.addfile(info, io.BytesIO(data))
+            os.replace(backup_path + ".tmp", backup_path)
+            self._record_backup(backup_path, 'full')
+
+            elapsed = max(time.monotonic() - started, 1e-6)
+            self.logger.info(f"Full backup created: {backup_path} "
+                             f"({total / 1024 / 1024:.1f} MB in {elapsed:.1f}s, "
+                             f"{total / 1024 / 1024 / elapsed:.1f} MB/s, {workers} workers, {codec})")
             return backup_path
-            
+
         except Exception as e:
             self.logger.error(f"Failed to create full backup: {e}")
+            if os.path.exists(backup_path + ".tmp"):
+                os.remove(backup_path + ".tmp")
+            return None
+        finally:
+            self._backup_lock.release()
+
+    def create_full_backup_async(self, progress=None, on_done=None, workers=None):
+        """Run create_full_backup on a background thread; ``on_done(path or None)`` when it ends"""
+        def run():
+            path = self.create_full_backup(progress=progress, workers=workers)
+            if on_done:
+                on_done(path)
+
+        thread = threading.Thread(target=run, name="full-backup", daemon=True)
+        thread.start()
+        return thread
+
+    def _restore_archive(self, backup_path, progress=None):
+        """Stream a tar backup, verifying every entry before anything is replaced"""
+        staged = []
+        root = os.path.abspath(self.project_root)
+        try:
+            started = time.monotonic()
+            done = 0
+            with tarfile.open(backup_path, "r|") as tar:
+                for member in tar:
+                    if member.name == MANIFEST_NAME or not member.isfile():
+                        continue
+                    arc_path = member.name
+                    for suffix in (".zst", ".gz"):
+                        if arc_path.endswith(suffix):
+                            arc_path = arc_path[:-len(suffix)]
+                    target = os.path.abspath(os.path.join(root, *arc_path.split("/")))
+                    if not target.startswith(root + os.sep):
+                        raise ValueError(f"unsafe path in backup: {member.name}")
+
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix=".restore")
+                    staged.append((tmp_path, target))
+                    digest = hashlib.sha256()
+                    size = 0
+                    with os.fdopen(fd, 'wb') as out:
+                        stream = _open_decompressed(tar.extractfile(member), member.name)
+                        for data in iter(lambda: stream.read(BLOCK_SIZE), b""):
+                            digest.update(data)
+                            size += len(data)
+                            out.write(data)
+                    expected = member.pax_headers.get(CHECKSUM_HEADER)
+                    if expected and (digest.hexdigest() != expected
+                                     or size != int(member.pax_headers.get(SIZE_HEADER, size))):
+                        raise ValueError(f"checksum mismatch for {arc_path}")
+
+                    done += size
+                    if progress:
+                        elapsed = max(time.monotonic() - started, 1e-6)
+                        progress(done, None, done / elapsed)
+
+            # Every entry verified: swap the files in
+            for tmp_path, target in staged:
+                os.replace(tmp_path, target)
+            staged = []
+            self.logger.info(f"Backup restored from: {backup_path}")
+            return True
+
+        except Exception as e:
+            self.logger.error(f"Failed to restore backup: {e}")
+            return False
+        finally:
+            for tmp_path, _ in staged:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    def _chunk_path(self, digest):
+        return os.path.join(self.chunk_dir, digest[:2], digest)
+
+    def _store_chunk(self, data):
+        """Store one chunk under its content hash; returns (digest, bytes written)"""
+        digest = hashlib.blake2b(data, digest_size=20).hexdigest()
+        path = self._chunk_path(digest)
+        if os.path.exists(path):
+            return digest, 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        compressed = zlib.compress(data, 6)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, 'wb') as f:
+            f.write(compressed)
+        os.replace(tmp_path, path)
+        return digest, len(compressed)
+
+    def _read_chunk(self, digest):
+        with open(self._chunk_path(digest), 'rb') as f:
+            data = zlib.decompress(f.read())
+        if hashlib.blake2b(data, digest_size=20).hexdigest() != digest:
+            raise ValueError(f"chunk {digest} is corrupt")
+        return data
+
+    def latest_snapshot(self):
+        """Path of the newest snapshot manifest, or None"""
+        try:
+            names = sorted(n for n in os.listdir(self.snapshot_dir) if n.endswith('.json'))
+        except FileNotFoundError:
+            return None
+        return os.path.join(self.snapshot_dir, names[-1]) if names else None
+
+    def load_manifest(self, manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def create_incremental_backup(self, max_rate=None):
+        """Snapshot config/ and data/ into the chunk store, storing only changed data
+
+        Files whose size and mtime match the previous snapshot reuse its
+        chunk list without being read; other files are split into fixed-size
+        chunks and only chunks not already in the store are written, so an
+        appended log costs roughly its new tail. ``max_rate`` caps reads in
+        bytes per second. Returns the manifest path.
+        """
+        started = time.monotonic()
+        read_bytes = 0
+        try:
+            os.makedirs(self.snapshot_dir, exist_ok=True)
+            parent_path = self.latest_snapshot()
+            previous = self.load_manifest(parent_path)["files"] if parent_path else {}
+            files = {}
+            stats = {"files": 0, "unchanged": 0, "bytes": 0, "stored_bytes": 0, "new_chunks": 0}
+
+            for file_path, arc_path in self._iter_backup_files():
+                arc_path = arc_path.replace(os.sep, "/")
+                stat = os.stat(file_path)
+                stats["files"] += 1
+                stats["bytes"] += stat.st_size
+                old = previous.get(arc_path)
+                if old and old["size"] == stat.st_size and old["mtime_ns"] == stat.st_mtime_ns:
+                    files[arc_path] = old
+                    stats["unchanged"] += 1
+                    continue
+                chunks = []
+                with open(file_path, 'rb') as f:
+                    for data in iter(lambda: f.read(CHUNK_SIZE), b""):
+                        read_bytes += len(data)
+                        if max_rate:
+                            # Throttle: sleep until the average read rate is back under the cap
+                            ahead = read_bytes / max_rate - (time.monotonic() - started)
+                            if ahead > 0:
+                                time.sleep(ahead)
+                        digest, written = self._store_chunk(data)
+                        chunks.append(digest)
+                        if written:
+                            stats["new_chunks"] += 1
+                            stats["stored_bytes"] += written
+                files[arc_path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "chunks": chunks}
+
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+            manifest_path = os.path.join(self.snapshot_dir, f"snapshot_{timestamp}.json")
+            manifest = {
+                "created": datetime.now().isoformat(),
+                "parent": os.path.basename(parent_path) if parent_path else None,
+                "chunk_size": CHUNK_SIZE,
+                "stats": stats,
+                "files": files,
+            }
+            with open(manifest_path + ".tmp", 'w', encoding='utf-8') as f:
+                json.dump(manifest, f)
+            os.replace(manifest_path + ".tmp", manifest_path)
+            self._record_backup(manifest_path, 'snapshot')
+
+            self.logger.info(
+                f"Incremental backup created: {manifest_path} "
+                f"({stats['unchanged']}/{stats['files']} files unchanged, {stats['new_chunks']} new chunks, "
+                f"{stats['stored_bytes'] / 1024:.0f} KB stored)"
+            )
+            return manifest_path
+
+        except Exception as e:
+            self.logger.error(f"Failed to create incremental backup: {e}")
             return None
-    
-    def restore_backup(self, backup_path):
+
+    def restore_snapshot(self, manifest_path):
+        """Rebuild every file of a snapshot from the chunk store, verifying each chunk"""
+        try:
+            manifest = self.load_manifest(manifest_path)
+            for arc_path, entry in manifest["files"].items():
+                target = os.path.join(self.project_root, *arc_path.split("/"))
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix=".restore")
+                try:
+                    with os.fdopen(fd, 'wb') as f:
+                        for digest in entry["chunks"]:
+                            f.write(self._read_chunk(digest))
+                    os.replace(tmp_path, target)
+                except Exception:
+                    os.remove(tmp_path)
+                    raise
+                os.utime(target, ns=(entry["mtime_ns"], entry["mtime_ns"]))
+
+            self.logger.info(f"Snapshot restored from: {manifest_path}")
+            return True
+
+        except Exception as e:
+            self.logger.error(f"Failed to restore snapshot: {e}")
+            return False
+
+    def prune_chunks(self):
+        """Delete chunks no snapshot refers to (after snapshots were removed)"""
+        referenced = set()
+        try:
+            for name in os.listdir(self.snapshot_dir):
+                if name.endswith('.json'):
+                    manifest = self.load_manifest(os.path.join(self.snapshot_dir, name))
+                    for entry in manifest["files"].values():
+                        referenced.update(entry["chunks"])
+        except FileNotFoundError:
+            pass
+        removed = 0
+        for root, dirs, files in os.walk(self.chunk_dir):
+            for file in files:
+                if file not in referenced:
+                    os.remove(os.path.join(root, file))
+                    removed += 1
+        self.logger.info(f"Pruned {removed} unreferenced backup chunks")
+        return removed
+
+    def restore_backup(self, backup_path, progress=None):
         """Restore from a backup file"""
+        if os.path.dirname(os.path.abspath(backup_path)) == os.path.abspath(self.snapshot_dir):
+            return self.restore_snapshot(backup_path)
+        if backup_path.endswith('.tar'):
+            return self._restore_archive(backup_path, progress)
         try:
             with zipfile.ZipFile(backup_path, 'r') as zip_file:
+                bad = zip_file.testzip()
+                if bad is not None:
+                    raise ValueError(f"CRC check failed for {bad}")
                 zip_file.extractall(self.project_root)
-            
+
             self.logger.info(f"Backup restored from: {backup_path}")
             return True
-            
+
         except Exception as e:
             self.logger.error(f"Failed to restore backup: {e}")
             return False
-    
+
+    def _scan_backups(self):
+        """Stat every backup file; only needed when the catalogue is missing or stale"""
+        entries = []
+        for folder, kind in ((self.backup_dir, 'full'), (self.snapshot_dir, 'snapshot')):
+            if not os.path.isdir(folder):
+                continue
+            for file in os.listdir(folder):
+                if file.endswith(('.zip', '.tar', '.json')) and file != CATALOGUE_NAME:
+                    entries.append(self._catalogue_entry(os.path.join(folder, file), kind))
+        return entries
+
+    def _catalogue_entry(self, path, kind):
+        stat = os.stat(path)
+        return {'name': os.path.basename(path), 'path': path, 'size': stat.st_size,
+                'created': stat.st_ctime, 'type': kind}
+
+    def _dir_stamps(self):
+        # Adding or removing a file changes its directory's mtime, so two stats detect outside edits
+        return [os.stat(folder).st_mtime_ns if os.path.isdir(folder) else 0
+                for folder in (self.backup_dir, self.snapshot_dir)]
+
+    def _load_catalogue(self):
+        """The cached backup list, rescanning only if the backup folders changed behind our back"""
+        if self._catalogue is None and os.path.exists(self.catalogue_path):
+            try:
+                with open(self.catalogue_path, 'r', encoding='utf-8') as f:
+                    self._catalogue = json.load(f)
+            except Exception as e:
+                self.logger.warning(f"Backup catalogue unreadable, rebuilding it: {e}")
+        if self._catalogue is None or self._catalogue.get("stamps") != self._dir_stamps():
+            self._catalogue = {"entries": self._scan_backups()}
+            self._save_catalogue()
+        return self._catalogue
+
+    def _save_catalogue(self):
+        try:
+            os.makedirs(self.backup_dir, exist_ok=True)
+            # Rewritten in place so saving it does not change the folder's mtime
+            with open(self.catalogue_path, 'w', encoding='utf-8') as f:
+                json.dump({"entries": self._catalogue["entries"], "stamps": self._dir_stamps()}, f)
+        except Exception as e:
+            self.logger.error(f"Failed to save backup catalogue: {e}")
+        self._catalogue["stamps"] = self._dir_stamps()
+
+    def _record_backup(self, path, kind):
+        with self._catalogue_lock:
+            # Our own write changed the folder's mtime: update the entry and re-stamp
+            # rather than treating it as an outside change and rescanning
+            catalogue = self._catalogue if self._catalogue is not None else self._load_catalogue()
+            entries = [e for e in catalogue["entries"] if e['path'] != path]
+            entries.append(self._catalogue_entry(path, kind))
+            catalogue["entries"] = entries
+            self._save_catalogue()
+
+    def _delete_backups(self, paths):
+        paths = set(paths)
+        with self._catalogue_lock:
+            catalogue = self._load_catalogue()
+            for path in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            catalogue["entries"] = [e for e in catalogue["entries"] if e['path'] not in paths]
+            self._save_catalogue()
+
+    def delete_backup(self, backup_path):
+        """Remove a backup file and its catalogue entry (chunks are freed by prune_chunks)"""
+        self._delete_backups([backup_path])
+
+    def apply_retention(self, hourly=24, daily=7, weekly=4):
+        """Thin out snapshots, keeping the newest one per hour, day and ISO week bucket
+
+        The newest ``hourly`` hours, ``daily`` days and ``weekly`` weeks that
+        have snapshots each keep one; the latest snapshot is always kept.
+        Returns the number of snapshots deleted.
+        """
+        snapshots = [b for b in self.list_backups() if b['type'] == 'snapshot']
+        keep = {snapshots[0]['path']} if snapshots else set()
+        for count, bucket in ((hourly, lambda d: d.strftime('%Y%m%d%H')),
+                              (daily, lambda d: d.strftime('%Y%m%d')),
+                              (weekly, lambda d: d.isocalendar()[:2])):
+            seen = set()
+            for backup in snapshots:
+                key = bucket(backup['created'])
+                if key in seen:
+                    continue
+                if len(seen) >= count:
+                    break
+                seen.add(key)
+                keep.add(backup['path'])
+
+        removed = [b for b in snapshots if b['path'] not in keep]
+        if removed:
+            self._delete_backups(b['path'] for b in removed)
+            self.prune_chunks()
+            self.logger.info(f"Retention removed {len(removed)} snapshots, kept {len(keep)}")
+        return len(removed)
+
     def list_backups(self):
         """List all available backups"""
-        backups = []
         try:
-            for file in os.listdir(self.backup_dir):
-                if file.endswith('.zip') or file.endswith('.json'):
-                    file_path = os.path.join(self.backup_dir, file)
-                    stat = os.stat(file_path)
-                    backups.append({
-                        'name': file,
-                        'path': file_path,
-                        'size': stat.st_size,
-                        'created': datetime.fromtimestamp(stat.st_ctime)
-                    })
+            with self._catalogue_lock:
+                entries = list(self._load_catalogue()["entries"])
         except Exception as e:
             self.logger.error(f"Failed to list backups: {e}")
-        
+            return []
+
+        backups = [dict(e, created=datetime.fromtimestamp(e['created'])) for e in entries]
         return sorted(backups, key=lambda x: x['created'], reverse=True)
+
+
+class BackupScheduler:
+    """Low-priority background snapshots of config/ and data/
+
+    Every ``poll`` seconds the thread checks whether ``interval`` seconds
+    have passed since the last snapshot and the app has been idle (no
+    ``touch()``) for ``idle_seconds``; if so it takes a throttled
+    incremental snapshot and applies the retention policy.
+    """
+
+    def __init__(self, manager, interval=3600, idle_seconds=120, max_rate=4*1024*1024,
+                 retention=None, poll=30):
+        self.manager = manager
+        self.interval = interval
+        self.idle_seconds = idle_seconds
+        self.max_rate = max_rate
+        self.retention = dict(DEFAULT_RETENTION, **(retention or {}))
+        self.poll = poll
+        self.logger = logging.getLogger(__name__)
+        self._last_activity = time.monotonic()
+        self._last_run = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def touch(self):
+        """Record user activity; snapshots wait until the app has been idle for a while"""
+        self._last_activity = time.monotonic()
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="backup-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def due(self):
+        if self._last_run is not None and time.monotonic() - self._last_run < self.interval:
+            return False
+        snapshots = [b for b in self.manager.list_backups() if b['type'] == 'snapshot']
+        if snapshots and (datetime.now() - snapshots[0]['created']).total_seconds() < self.interval:
+            return False
+        return time.monotonic() - self._last_activity >= self.idle_seconds
+
+    def run_once(self):
+        self._last_run = time.monotonic()
+        if self.manager.create_incremental_backup(max_rate=self.max_rate):
+            self.manager.apply_retention(**self.retention)
+
+    def _run(self):
+        while not self._stop.wait(self.poll):
+            try:
+                if self.due():
+                    self.run_once()
+            except Exception as e:
+                self.logger.error(f"Scheduled backup failed: {e}")
@@ -0,0 +1,77 @@
+"""
+Build palette-compressed sprite atlases for the avatar mood clips
+
+Each clip is decoded once, resized to the display size and written next
+to the video as <clip>.atlas. The app memory-maps these instead of
+decoding the MP4, so the avatar starts instantly and costs no H.264 work.
+
+Usage:
+    python build_avatar_atlas.py                  # every .mp4 in assets/avatars
+    python build_avatar_atlas.py path/to/clip.mp4 --size 512x750
+"""
+
+import argparse
+import glob
+import os
+import sys
+
+from avatar_frames import atlas_path_for, decode_clip, write_atlas
+
+DEFAULT_AVATAR_DIR = "assets/avatars"
+DEFAULT_SIZE = "512x750"
+
+
+def parse_size(value):
+    try:
+        width, height = (int(part) for part in value.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"size must look like 512x750, got '{value}'")
+    return width, height
+
+
+def build(path, size, colors, force=False):
+    atlas_path = atlas_path_for(path)
+    if not force and os.path.exists(atlas_path) and os.path.getmtime(atlas_path) >= os.path.getmtime(path):
+        print(f"✓ {atlas_path} is up to date")
+        return atlas_path
+
+    frames, fps = decode_clip(path, size)
+    if not len(frames):
+        print(f"✗ {path}: no frames decoded")
+        return None
+
+    write_atlas(frames, fps, atlas_path, colors=colors)
+    video_mb = os.path.getsize(path) / 1024 / 1024
+    atlas_mb = os.path.getsize(atlas_path) / 1024 / 1024
+    print(f"✓ {atlas_path}: {len(frames)} frames @ {fps:.1f} fps, {size[0]}x{size[1]}, "
+          f"{atlas_mb:.1f} MB (video {video_mb:.1f} MB)")
+    return atlas_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert avatar clips into memory-mappable sprite atlases")
+    parser.add_argument("clips", nargs="*", help=f"video files (default: {DEFAULT_AVATAR_DIR}/*.mp4)")
+    parser.add_argument("--size", type=parse_size, default=parse_size(DEFAULT_SIZE),
+                        help=f"display size as WIDTHxHEIGHT (default {DEFAULT_SIZE})")
+    parser.add_argument("--colors", type=int, default=256, help="palette size, at most 256")
+    parser.add_argument("--force", action="store_true", help="rebuild even if the atlas is newer than the clip")
+    args = parser.parse_args()
+
+    clips = args.clips or sorted(glob.glob(os.path.join(DEFAULT_AVATAR_DIR, "*.mp4")))
+    if not clips:
+        print(f"No clips found in {DEFAULT_AVATAR_DIR}")
+        return 1
+
+    failed = 0
+    for clip in clips:
+        try:
+            if build(clip, args.size, min(args.colors, 256), args.force) is None:
+                failed += 1
+        except Exception as e:
+            print(f"✗ {clip}: {e}")
+            failed += 1
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,17 +1,23 @@
 import os
 import sys
-import queue
 import json
 import threading
 import sounddevice as sd
 import vosk
 import pyttsx3
 
+from speech_pipeline import BoundedStage, DROP_OLDEST, COALESCE, format_metrics
+
 # =========================
 # CONFIG
 # =========================
 VOSK_MODEL_PATH = r"C:\Users\Justin\Documents\CompanionAI\vosk-model-small-en-us-0.15"
 
+# Pipeline queue bounds (each audio block is 0.5s at 16kHz / 8000 frames)
+AUDIO_QUEUE_BLOCKS = 16   # ~8s of audio before the oldest blocks are dropped
+REPLY_QUEUE_SIZE = 2      # pending utterances beyond this are merged together
+SPEECH_QUEUE_SIZE = 2     # pending replies beyond this drop the oldest
+
 # =========================
 # SETUP
 # =========================
@@ -22,7 +28,6 @@ if not os.path.exists(VOSK_MODEL_PATH):
 model = vosk.Model(VOSK_MODEL_PATH)
 recognizer = vosk.KaldiRecognizer(model, 16000)
 
-audio_queue = queue.Queue()
 engine = pyttsx3.init()
 
 # Configure voice
@@ -49,13 +54,41 @@ def get_carmen_reply(user_text: str) -> str:
     # TODO: Replace with your NSFW-3B model or local LLM call
     return f"I heard you say: '{user_text}'. I'm here with you."
 
+# =========================
+# Pipeline Stages
+# capture -> recognize -> reply -> speak, each on its own thread
+# =========================
+def recognize_audio(data: bytes):
+    if recognizer.AcceptWaveform(data):
+        result = json.loads(recognizer.Result())
+        text = result.get("text", "").strip()
+        if text:
+            print(f"You: {text}")
+            return text
+    return None
+
+def generate_reply(user_text: str):
+    reply = get_carmen_reply(user_text)
+    print(f"Carmen: {reply}")
+    return reply
+
+def join_utterances(pending: str, new: str) -> str:
+    return f"{pending} {new}"
+
+speech_stage = BoundedStage("speak", speak_text, maxsize=SPEECH_QUEUE_SIZE, policy=DROP_OLDEST)
+reply_stage = BoundedStage("reply", generate_reply, maxsize=REPLY_QUEUE_SIZE, policy=COALESCE,
+                           merge=join_utterances, output=speech_stage)
+recognize_stage = BoundedStage("recognize", recognize_audio, maxsize=AUDIO_QUEUE_BLOCKS,
+                               policy=DROP_OLDEST, output=reply_stage)
+PIPELINE = [recognize_stage, reply_stage, speech_stage]
+
 # =========================
 # Audio Callback
 # =========================
 def audio_callback(indata, frames, time, status):
     if status:
         print("Audio status:", status)
-    audio_queue.put(bytes(indata))
+    recognize_stage.put(bytes(indata))
 
 # =========================
 # Mic Listener Thread
@@ -64,12 +97,7 @@ def mic_listener():
     with sd.RawInputStream(samplerate=16000, blocksize=8000, dtype="int16",
                            channels=1, callback=audio_callback):
         print("🎤 Microphone is live... Speak anytime.")
-        while True:
-            data = audio_queue.get()
-            if recognizer.AcceptWaveform(data):
-                result = json.loads(recognizer.Result())
-                if result.get("text"):
-                    handle_input(result["text"])
+        threading.Event().wait()
 
 # =========================
 # Input Handler
@@ -77,21 +105,25 @@ def mic_listener():
 def handle_input(user_text: str):
     if not user_text.strip():
         return
+    if user_text.strip() == "/stats":
+        print(format_metrics(PIPELINE))
+        return
     print(f"You: {user_text}")
-    reply = get_carmen_reply(user_text)
-    print(f"Carmen: {reply}")
-    speak_text(reply)
+    reply_stage.put(user_text.strip())
 
 # =========================
 # Main Loop
 # =========================
 def main():
+    for stage in PIPELINE:
+        stage.start()
+
     # Start mic thread
     mic_thread = threading.Thread(target=mic_listener, daemon=True)
     mic_thread.start()
 
     # Typing option stays available
-    print("✅ Carmen is ready. Type or speak to interact.\n")
+    print("✅ Carmen is ready. Type or speak to interact (/stats for pipeline metrics).\n")
     while True:
         try:
             user_text = input("You (typing): ")
@@ -100,5 +132,8 @@ def main():
             print("\nExiting...")
             break
 
+    for stage in PIPELINE:
+        stage.stop()
+
 if __name__ == "__main__":
     main()
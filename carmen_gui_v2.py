@@ -1,11 +1,11 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-import json
-import os
 import threading
 import time
 import sys
 
+from config_manager import COMPANION_SCHEMA, get_config
+
 # PIL support for avatars
 try:
     from PIL import Image, ImageTk
@@ -16,18 +16,14 @@ except ImportError:
 # Optional: GGUF model support
 MODEL_PATH = r'C:\Users\Justin\LocalLLM\bin\orca-mini-3b-gguf2-q4_0.gguf'
 
-# Load personality config
+# Load personality config (shared and hot-reloaded by the config service)
 CONFIG_PATH = 'enhanced_companion_config.json'
-if os.path.exists(CONFIG_PATH):
-    with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
-        CONFIG = json.load(f)
-else:
-    CONFIG = {
-        'name': 'Carmen',
-        'style': '💖 sweet and supportive',
-        'voice': 'gentle',
-        'emoji': '🌸'
-    }
+CONFIG = get_config(CONFIG_PATH, defaults={
+    'name': 'Carmen',
+    'style': '💖 sweet and supportive',
+    'voice': 'gentle',
+    'emoji': '🌸'
+}, schema=COMPANION_SCHEMA)
 
 
 class CarmenAICompanion:
@@ -1,13 +1,14 @@
 
 import tkinter as tk
 from tkinter import ttk, messagebox
-import json
 import os
 import threading
 import time
 import pyttsx3
 
 from llm_runner import GGUFModelRunner
+from chat_history import ChatHistoryLog
+from ui_utils import trim_text_widget
 
 try:
     from PIL import Image, ImageTk
@@ -17,7 +18,9 @@ except ImportError:
 
 CONFIG_PATH = 'config/enhanced_companion_config.json'
 AVATAR_PATH = 'assets/avatars/avatar_carmen.png'
-MEMORY_PATH = 'data/chat_history/current_chat.json'
+MEMORY_PATH = 'data/chat_history/current_chat.json'  # legacy format, imported once
+HISTORY_PATH = 'data/chat_history/current_chat.jsonl'
+SCROLLBACK_LINES = 1000  # oldest lines are trimmed from the chat pane beyond this
 
 DEFAULT_MOODS = {
     "Supportive": {"prompt": "You're sweet, caring, gentle.", "emoji": "💖"},
@@ -34,7 +37,7 @@ class CarmenAICompanion:
         self.root.configure(bg="#ffe6f0")
         self.font = ("Segoe UI", 11)
         self.name = "Carmen"
-        self.memory = []
+        self.history = ChatHistoryLog(HISTORY_PATH)
         self.llm = GGUFModelRunner()
         self.mood = "Supportive"
 
@@ -98,8 +101,7 @@ class CarmenAICompanion:
         if not message or message == "💖 Type your message here...":
             return
         self._append_message("You", message, user=True)
-        self.memory.append({"role": "user", "content": message})
-        self._save_memory()
+        self.history.append({"role": "user", "content": message})
         self.message_entry.delete("1.0", tk.END)
         threading.Thread(target=self._query_model, args=(message,), daemon=True).start()
 
@@ -107,6 +109,7 @@ class CarmenAICompanion:
         self.chat_display.config(state="normal")
         prefix = "🧍 You:" if user else f"{DEFAULT_MOODS[self.mood]['emoji']} {self.name}:"
         self.chat_display.insert(tk.END, f"{prefix} {message}\n")
+        trim_text_widget(self.chat_display, SCROLLBACK_LINES)
         self.chat_display.config(state="disabled")
         self.chat_display.see(tk.END)
 
@@ -117,29 +120,19 @@ class CarmenAICompanion:
             response = self.llm.prompt(prompt, system_prompt=system_prompt)
         except Exception as e:
             response = f"Sorry, I had a brain freeze: {e}"
-        self.memory.append({"role": "assistant", "content": response})
-        self._save_memory()
+        self.history.append({"role": "assistant", "content": response})
         self._append_message(self.name, response, user=False)
         self.tts.say(response)
         self.tts.runAndWait()
 
-    def _save_memory(self):
+    def _load_memory(self):
         try:
-            os.makedirs(os.path.dirname(MEMORY_PATH), exist_ok=True)
-            with open(MEMORY_PATH, "w", encoding="utf-8") as f:
-                json.dump(self.memory, f, indent=2)
+            self.history.import_json(MEMORY_PATH)
+            # The full history stays on disk; only what fits the scrollback is rendered
+            for msg in self.history.tail(SCROLLBACK_LINES):
+                self._append_message("You" if msg["role"] == "user" else self.name, msg["content"], user=(msg["role"] == "user"))
         except Exception as e:
-            print(f"[Memory Save Error] {e}")
-
-    def _load_memory(self):
-        if os.path.exists(MEMORY_PATH):
-            try:
-                with open(MEMORY_PATH, "r", encoding="utf-8") as f:
-                    self.memory = json.load(f)
-                for msg in self.memory:
-                    self._append_message("You" if msg["role"] == "user" else self.name, msg["content"], user=(msg["role"] == "user"))
-            except Exception as e:
-                print(f"[Memory Load Error] {e}")
+            print(f"[Memory Load Error] {e}")
 
 if __name__ == '__main__':
     app = CarmenAICompanion()
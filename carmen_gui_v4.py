@@ -1,11 +1,13 @@
 
 import tkinter as tk
 from tkinter import ttk
-import json
+import collections
 import os
 import threading
 import pyttsx3
 from llm_runner import GGUFModelRunner
+from chat_history import ChatHistoryLog
+from config_manager import UI_STATE_SCHEMA, get_config
 
 try:
     from PIL import Image, ImageTk
@@ -15,8 +17,11 @@ except ImportError:
 
 CONFIG_PATH = 'config/enhanced_companion_config.json'
 AVATAR_DIR = 'assets/avatars/'
-MEMORY_PATH = 'data/chat_history/current_chat.json'
+MEMORY_PATH = 'data/chat_history/current_chat.json'  # legacy format, imported once
+HISTORY_PATH = 'data/chat_history/current_chat.jsonl'
 MOOD_STATE_PATH = 'config/ui_config.json'
+HISTORY_PAGE_SIZE = 50  # messages rendered at startup and per scroll-back page
+SCROLLBACK_MESSAGES = 500  # oldest rendered messages are trimmed beyond this
 
 DEFAULT_MOODS = {
     "Supportive": {"prompt": "You're sweet, caring, gentle.", "emoji": "💖", "voice": {"rate": 175}},
@@ -35,7 +40,10 @@ class CarmenAICompanion:
 
         self.llm = GGUFModelRunner()
         self.tts = pyttsx3.init()
-        self.memory = []
+        self.history = ChatHistoryLog(HISTORY_PATH)
+        self.history_start = len(self.history)  # index of the oldest message shown
+        self.shown_line_counts = collections.deque()  # text lines per rendered message
+        self._loading_older = False
         self.avatar_photo = None
 
         self.mood = self._load_last_mood()
@@ -50,7 +58,8 @@ class CarmenAICompanion:
         self.avatar_label.pack(side="left", padx=(0, 12), anchor="n")
         self._update_avatar()
 
-        self.chat_display = tk.Text(top, wrap="word", state="disabled", bg="white", fg="black", font=self.font)
+        self.chat_display = tk.Text(top, wrap="word", state="disabled", bg="white", fg="black", font=self.font,
+                                    yscrollcommand=self._on_chat_scroll)
         self.chat_display.pack(fill="both", expand=True, side="left")
 
         bottom = tk.Frame(self.root, bg="#ffe6f0")
@@ -101,18 +110,63 @@ class CarmenAICompanion:
         if not message or message == "💖 Type your message here...":
             return
         self._append_message("You", message, user=True)
-        self.memory.append({"role": "user", "content": message})
-        self._save_memory()
+        self.history.append({"role": "user", "content": message})
         self.message_entry.delete("1.0", tk.END)
         threading.Thread(target=self._query_model, args=(message,), daemon=True).start()
 
+    def _format_message(self, message, user=False):
+        prefix = "🧍 You:" if user else f"{DEFAULT_MOODS[self.mood]['emoji']} Carmen:"
+        return f"{prefix} {message}\n"
+
+    def _format_history(self, messages):
+        return [self._format_message(msg["content"], user=(msg["role"] == "user")) for msg in messages]
+
     def _append_message(self, sender, message, user=False):
+        text = self._format_message(message, user)
         self.chat_display.config(state="normal")
-        prefix = "🧍 You:" if user else f"{DEFAULT_MOODS[self.mood]['emoji']} Carmen:"
-        self.chat_display.insert(tk.END, f"{prefix} {message}\n")
+        self.chat_display.insert(tk.END, text)
+        self.shown_line_counts.append(text.count("\n"))
+        self._trim_scrollback()
         self.chat_display.config(state="disabled")
         self.chat_display.see(tk.END)
 
+    def _trim_scrollback(self):
+        # Drop the oldest rendered messages in batches; they can be paged back in on scroll-up
+        excess = len(self.shown_line_counts) - SCROLLBACK_MESSAGES
+        if excess <= SCROLLBACK_MESSAGES // 10:
+            return
+        lines = sum(self.shown_line_counts.popleft() for _ in range(excess))
+        self.chat_display.delete("1.0", f"{lines + 1}.0")
+        self.history_start += excess
+
+    def _on_chat_scroll(self, first, last):
+        # Reaching the top of the pane pulls in the previous page of history
+        if float(first) <= 0.0 and self.history_start > 0 and not self._loading_older:
+            self._loading_older = True
+            self.root.after_idle(self._load_older_messages)
+
+    def _load_older_messages(self):
+        try:
+            if self.chat_display.yview()[0] > 0.0:
+                return  # scrolled away from the top before the idle callback ran
+            start = max(0, self.history_start - HISTORY_PAGE_SIZE)
+            parts = self._format_history(self.history.read(start, self.history_start))
+            self.history_start = start
+            if not parts:
+                return
+            text = "".join(parts)
+            self.shown_line_counts.extendleft(part.count("\n") for part in reversed(parts))
+            top_line = int(self.chat_display.index("@0,0").split(".")[0])
+            self.chat_display.config(state="normal")
+            self.chat_display.insert("1.0", text)
+            self.chat_display.config(state="disabled")
+            # Keep the previously visible line in place instead of jumping to the top
+            self.chat_display.yview(f"{top_line + text.count(chr(10))}.0")
+        except Exception as e:
+            print(f"[Memory Load Error] {e}")
+        finally:
+            self._loading_older = False
+
     def _query_model(self, prompt):
         try:
             mood_data = DEFAULT_MOODS[self.mood]
@@ -120,8 +174,7 @@ class CarmenAICompanion:
             response = self.llm.prompt(prompt, system_prompt=system_prompt)
         except Exception as e:
             response = f"Sorry, I had a brain freeze: {e}"
-        self.memory.append({"role": "assistant", "content": response})
-        self._save_memory()
+        self.history.append({"role": "assistant", "content": response})
         self._append_message("Carmen", response, user=False)
         self._speak(response)
 
@@ -132,41 +185,28 @@ class CarmenAICompanion:
         self.tts.say(text)
         self.tts.runAndWait()
 
-    def _save_memory(self):
+    def _load_memory(self):
         try:
-            os.makedirs(os.path.dirname(MEMORY_PATH), exist_ok=True)
-            with open(MEMORY_PATH, "w", encoding="utf-8") as f:
-                json.dump(self.memory, f, indent=2)
+            self.history.import_json(MEMORY_PATH)
+            # Only the latest page is rendered; older pages load on scroll-up
+            self.history_start = max(0, len(self.history) - HISTORY_PAGE_SIZE)
+            parts = self._format_history(self.history.read(self.history_start))
+            self.shown_line_counts.extend(part.count("\n") for part in parts)
+            self.chat_display.config(state="normal")
+            self.chat_display.insert(tk.END, "".join(parts))
+            self.chat_display.config(state="disabled")
+            self.chat_display.see(tk.END)
         except Exception as e:
-            print(f"[Memory Save Error] {e}")
-
-    def _load_memory(self):
-        if os.path.exists(MEMORY_PATH):
-            try:
-                with open(MEMORY_PATH, "r", encoding="utf-8") as f:
-                    self.memory = json.load(f)
-                for msg in self.memory:
-                    self._append_message("You" if msg["role"] == "user" else "Carmen", msg["content"], user=(msg["role"] == "user"))
-            except Exception as e:
-                print(f"[Memory Load Error] {e}")
+            print(f"[Memory Load Error] {e}")
 
     def _save_last_mood(self):
-        try:
-            os.makedirs(os.path.dirname(MOOD_STATE_PATH), exist_ok=True)
-            with open(MOOD_STATE_PATH, "w", encoding="utf-8") as f:
-                json.dump({"last_mood": self.mood}, f, indent=2)
-        except Exception as e:
-            print(f"[Mood Save Error] {e}")
+        # Debounced: flipping through moods costs one write
+        self.ui_state["last_mood"] = self.mood
 
     def _load_last_mood(self):
-        if os.path.exists(MOOD_STATE_PATH):
-            try:
-                with open(MOOD_STATE_PATH, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                    return data.get("last_mood", "Supportive")
-            except Exception:
-                pass
-        return "Supportive"
+        self.ui_state = get_config(MOOD_STATE_PATH, defaults={"last_mood": "Supportive"}, schema=UI_STATE_SCHEMA)
+        mood = self.ui_state.get("last_mood")
+        return mood if mood in DEFAULT_MOODS else "Supportive"
 
 if __name__ == '__main__':
     app = CarmenAICompanion()
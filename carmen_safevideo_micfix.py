@@ -99,6 +99,7 @@ try:
     # Monkey-patch
     _orig_VC = cv2.VideoCapture
     def _patched_VC(path, *a, **k): return AsyncVideoCapture(path)
+    _patched_VC.unpatched = _orig_VC  # avatar frame cache decodes clips losslessly
     cv2.VideoCapture = _patched_VC
     print("[SafeBoot] Video: async preloader enabled. Gray-screen stutters suppressed.")
 except Exception as e:
@@ -0,0 +1,648 @@
+"""
+Headless server for Local AI Companion
+Exposes chat (token streaming over WebSocket or chunked HTTP), TTS audio
+streaming and memory endpoints on a local asyncio server, using the same
+LLM, TTS and memory components as the GUI. Standard library only. Each
+user ("user" field, ?user= or an X-Carmen-User header) gets an isolated
+session; all of them share one model instance.
+
+Usage:
+    python carmen_server.py                    # http://127.0.0.1:8765
+    python carmen_server.py --backend llama    # llama.cpp with continuous batching
+    python carmen_server.py --backend echo     # no model, for load testing
+
+Endpoints:
+    GET  /health
+    POST /chat            {"message": "...", "mood": "...", "stream": false}
+    POST /tts             {"text": "...", "voice": "..."}   -> audio/mpeg stream
+    GET  /memory/summary
+    GET  /memory/topics?k=5
+    GET  /memory/search?q=...&k=3
+    POST /memory/topic    {"topic": "...", "importance": 1}
+    POST /memory/detail   {"category": "...", "detail": "...", "value": ...}
+    GET  /history?n=20
+    GET  /sessions
+    GET  /metrics         Prometheus text (per-turn latency and throughput)
+    GET  /metrics/recent?n=20
+    GET  /ws/chat         WebSocket: send {"message": ...} or {"tts": ...}
+"""
+
+import argparse
+import asyncio
+import base64
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import struct
+import sys
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+from config_manager import COMPANION_SCHEMA, MODEL_SCHEMA, get_config
+from memory_vectors import make_embedder
+from perf_metrics import PerfMetrics, prometheus_gauge
+from session_manager import SessionManager
+
+CONFIG_PATH = "config/enhanced_companion_config.json"
+MODEL_CONFIG_PATH = "model_config.json"
+PERF_METRICS_PATH = "logs/server_perf_metrics.jsonl"
+SESSION_SWEEP_SECONDS = 60
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_VOICE = "en-US-AriaNeural"
+MAX_BODY_BYTES = 1024 * 1024
+MAX_PROMPT_CHARS = 4000
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC11B85"
+WS_TEXT, WS_BINARY, WS_CLOSE, WS_PING, WS_PONG = 0x1, 0x2, 0x8, 0x9, 0xA
+
+STATUS_TEXT = {
+    200: "OK", 101: "Switching Protocols", 400: "Bad Request", 404: "Not Found",
+    405: "Method Not Allowed", 413: "Payload Too Large", 429: "Too Many Requests",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class EchoBackend:
+    """Stand-in model that streams the prompt's last line back, for benchmarks"""
+
+    name = "echo"
+    parallel = 1
+
+    def stream(self, prompt, max_tokens, temperature, cancelled, turn=None):
+        last = prompt.rstrip().rsplit("User:", 1)[-1].replace("Carmen:", "").strip()
+        for word in f"I heard you say: {last}".split()[:max_tokens]:
+            if cancelled.is_set():
+                return
+            yield word + " "
+
+
+class GPT4AllBackend:
+    """The GGUF model from model_config.json, loaded once through gpt4all"""
+
+    name = "gpt4all"
+    parallel = 1
+
+    def __init__(self, model_path):
+        from gpt4all import GPT4All
+        self.model = GPT4All(os.path.basename(model_path), model_path=os.path.dirname(model_path),
+                             allow_download=False)
+
+    def stream(self, prompt, max_tokens, temperature, cancelled, turn=None):
+        for token in self.model.generate(prompt, max_tokens=max_tokens, temp=temperature, streaming=True):
+            if cancelled.is_set():
+                return
+            yield token
+
+
+class CompanionService:
+    """Model and TTS shared by every connection; memory lives in per-user sessions
+
+    Generations run on the session scheduler's worker thread, one at a
+    time in round-robin order across users; tokens are handed to the
+    event loop as they are produced.
+    """
+
+    def __init__(self, backend, config, sessions, metrics=None):
+        self.backend = backend
+        self.config = config
+        self.sessions = sessions
+        self.metrics = metrics or PerfMetrics()
+        self.logger = logging.getLogger(__name__)
+
+    def build_prompt(self, session, message):
+        style = self.config.get("style", "")
+        hits = session.vector_memory.search(
+            message,
+            k=int(self.config.get("memory_top_k", 3)),
+            budget_ms=float(self.config.get("memory_budget_ms", 50))
+        )
+        memories = "\n".join(f"- {entry['text']}" for _, entry in hits)
+        if memories:
+            prompt = f"{style}\n\nThings you remember:\n{memories}\n\nUser: {message}\nCarmen:"
+        else:
+            prompt = f"{style}\n\nUser: {message}\nCarmen:"
+        return prompt[-MAX_PROMPT_CHARS:]
+
+    async def stream_reply(self, session, message, mood=None):
+        """Yield reply tokens as the model produces them"""
+        loop = asyncio.get_running_loop()
+        turn = self.metrics.start_turn("server", session.user_id)
+        if mood:
+            session.mood = mood
+        mood = session.mood
+        prompt = await loop.run_in_executor(None, self.build_prompt, session, message)
+        tokens = asyncio.Queue()
+        cancelled = threading.Event()
+        done = object()
+
+        def produce():
+            turn.begin()
+            error = None
+            try:
+                for token in self.backend.stream(
+                    prompt,
+                    int(self.config.get("max_tokens", 300)),
+                    float(self.config.get("temperature", 0.9)),
+                    cancelled,
+                    turn=turn
+                ):
+                    turn.token()
+                    loop.call_soon_threadsafe(tokens.put_nowait, token)
+            except Exception as e:
+                error = e
+                loop.call_soon_threadsafe(tokens.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(tokens.put_nowait, done)
+                turn.generation_done(error)
+                self.metrics.record(turn)
+
+        try:
+            self.sessions.scheduler.submit(session.user_id, produce)
+        except RuntimeError as e:
+            raise HTTPError(429, str(e))
+        parts = []
+        try:
+            while True:
+                token = await tokens.get()
+                if token is done:
+                    break
+                if isinstance(token, Exception):
+                    raise token
+                parts.append(token)
+                yield token
+        finally:
+            # Stops the model early if the client went away
+            cancelled.set()
+
+        reply = "".join(parts).strip()
+        await loop.run_in_executor(None, self.remember, session, message, reply, mood)
+
+    def remember(self, session, message, reply, mood):
+        session.history.extend([{"role": "user", "content": message}, {"role": "assistant", "content": reply}])
+        session.vector_memory.add(f"User: {message}\nCarmen: {reply}", kind="turn", mood=mood)
+        session.memory.add_emotional_state(mood, message[:100])
+
+    async def reply(self, session, message, mood=None):
+        return "".join([token async for token in self.stream_reply(session, message, mood)]).strip()
+
+    async def synthesize(self, text, voice=None):
+        """Yield MP3 audio chunks from Edge TTS as they arrive"""
+        try:
+            import edge_tts
+        except ImportError:
+            raise HTTPError(503, "edge-tts is not installed")
+        voice = voice or self.config.get("tts_voice", DEFAULT_VOICE)
+        turn = self.metrics.start_turn("tts")
+        turn.tts_begin()
+        try:
+            async for chunk in edge_tts.Communicate(text, voice).stream():
+                if chunk["type"] == "audio":
+                    turn.playback_started()  # first audio a client could start playing
+                    yield chunk["data"]
+        finally:
+            turn.tts_done()
+            self.metrics.record(turn)
+
+
+class Request:
+    def __init__(self, method, target, version, headers, body):
+        parts = urlsplit(target)
+        self.method = method
+        self.path = parts.path
+        self.query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+        self.version = version
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        try:
+            data = json.loads(self.body or b"{}")
+        except ValueError:
+            raise HTTPError(400, "body must be JSON")
+        if not isinstance(data, dict):
+            raise HTTPError(400, "body must be a JSON object")
+        return data
+
+    def int_param(self, name, default):
+        return parse_int(self.query.get(name, default), name)
+
+    @property
+    def keep_alive(self):
+        connection = self.headers.get("connection", "").lower()
+        return connection != "close" if self.version == "HTTP/1.1" else connection == "keep-alive"
+
+
+def parse_int(value, name):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise HTTPError(400, f"'{name}' must be an integer")
+
+
+async def read_request(reader):
+    """Parse one HTTP/1.x request; None when the client closed the connection"""
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+    except asyncio.LimitOverrunError:
+        raise HTTPError(413, "headers too large")
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, version = lines[0].split(" ", 2)
+    except ValueError:
+        raise HTTPError(400, "malformed request line")
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length", 0) or 0)
+    except ValueError:
+        raise HTTPError(400, "malformed Content-Length")
+    if length < 0:
+        raise HTTPError(400, "malformed Content-Length")
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(413, "body too large")
+    body = await reader.readexactly(length) if length else b""
+    return Request(method, target, version, headers, body)
+
+
+def _head(status, content_type, keep_alive, length=None, extra=None):
+    lines = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}", f"Content-Type: {content_type}",
+             f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+    lines.append(f"Content-Length: {length}" if length is not None else "Transfer-Encoding: chunked")
+    lines.extend(extra or [])
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+async def send_json(writer, status, payload, keep_alive=True):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    writer.write(_head(status, "application/json; charset=utf-8", keep_alive, len(body)) + body)
+    await writer.drain()
+
+
+async def send_chunked(writer, content_type, chunks, keep_alive=True):
+    """Stream an async iterator of bytes with chunked transfer encoding"""
+    # Wait for the first chunk before committing to a 200, so early errors get a proper status
+    chunks = chunks.__aiter__()
+    try:
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        first = b""
+    writer.write(_head(200, content_type, keep_alive))
+    if first:
+        writer.write(b"%x\r\n%s\r\n" % (len(first), first))
+    async for chunk in chunks:
+        if chunk:
+            writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+            await writer.drain()
+    writer.write(b"0\r\n\r\n")
+    await writer.drain()
+
+
+class CompanionServer:
+    def __init__(self, service):
+        self.service = service
+        self.logger = logging.getLogger(__name__)
+        self.routes = {
+            ("GET", "/health"): self.health,
+            ("POST", "/chat"): self.chat,
+            ("POST", "/tts"): self.tts,
+            ("GET", "/memory/summary"): self.memory_summary,
+            ("GET", "/memory/topics"): self.memory_topics,
+            ("GET", "/memory/search"): self.memory_search,
+            ("POST", "/memory/topic"): self.memory_topic,
+            ("POST", "/memory/detail"): self.memory_detail,
+            ("GET", "/history"): self.history,
+            ("GET", "/sessions"): self.list_sessions,
+            ("GET", "/metrics"): self.prometheus_metrics,
+            ("GET", "/metrics/recent"): self.recent_metrics,
+        }
+
+    @contextlib.asynccontextmanager
+    async def session_for(self, request, data=None):
+        """The caller's session, opened off the event loop and pinned until the block exits"""
+        user = (data or {}).get("user") or request.query.get("user") or request.headers.get("x-carmen-user")
+        sessions = self.service.sessions
+        session = await asyncio.get_running_loop().run_in_executor(None, sessions.acquire, user)
+        try:
+            yield session
+        finally:
+            sessions.release(session)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                    if request is None:
+                        break
+                    if request.path == "/ws/chat":
+                        await self.websocket_chat(request, reader, writer)
+                        break
+                    handler = self.routes.get((request.method, request.path))
+                    if handler is None:
+                        known = any(path == request.path for _, path in self.routes)
+                        raise HTTPError(405 if known else 404, f"no route for {request.method} {request.path}")
+                    await handler(request, writer)
+                except HTTPError as e:
+                    await send_json(writer, e.status, {"error": str(e)}, keep_alive=False)
+                    break
+                if not request.keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            self.logger.exception(f"Request failed: {e}")
+            try:
+                await send_json(writer, 500, {"error": str(e)}, keep_alive=False)
+            except Exception:
+                pass
+        finally:
+            writer.close()
+
+    async def health(self, request, writer):
+        await send_json(writer, 200, {"status": "ok", "backend": self.service.backend.name},
+                        request.keep_alive)
+
+    async def chat(self, request, writer):
+        data = request.json()
+        message = str(data.get("message", "")).strip()
+        if not message:
+            raise HTTPError(400, "message is required")
+        async with self.session_for(request, data) as session:
+            if data.get("stream"):
+                tokens = (token.encode("utf-8")
+                          async for token in self.service.stream_reply(session, message, data.get("mood")))
+                await send_chunked(writer, "text/plain; charset=utf-8", tokens, request.keep_alive)
+                return
+            started = time.perf_counter()
+            reply = await self.service.reply(session, message, data.get("mood"))
+        await send_json(writer, 200, {"reply": reply, "ms": round((time.perf_counter() - started) * 1000, 1)},
+                        request.keep_alive)
+
+    async def tts(self, request, writer):
+        data = request.json()
+        text = str(data.get("text", "")).strip()
+        if not text:
+            raise HTTPError(400, "text is required")
+        await send_chunked(writer, "audio/mpeg", self.service.synthesize(text, data.get("voice")),
+                           request.keep_alive)
+
+    async def memory_summary(self, request, writer):
+        async with self.session_for(request) as session:
+            summary = dict(session.memory.get_memory_summary(), mood=session.mood)
+        await send_json(writer, 200, summary, request.keep_alive)
+
+    async def memory_topics(self, request, writer):
+        k = request.int_param("k", 5)
+        async with self.session_for(request) as session:
+            topics = [{"topic": topic, "count": count} for topic, count in session.memory.top_frequent_topics(k)]
+        await send_json(writer, 200, {"topics": topics}, request.keep_alive)
+
+    async def memory_search(self, request, writer):
+        query = request.query.get("q", "")
+        k = request.int_param("k", 3)
+        async with self.session_for(request) as session:
+            hits = await asyncio.get_running_loop().run_in_executor(
+                None, lambda: session.vector_memory.search(query, k=k)
+            )
+        await send_json(writer, 200, {"hits": [dict(entry, score=round(score, 4)) for score, entry in hits]},
+                        request.keep_alive)
+
+    async def memory_topic(self, request, writer):
+        data = request.json()
+        if not data.get("topic"):
+            raise HTTPError(400, "topic is required")
+        importance = parse_int(data.get("importance", 1), "importance")
+        async with self.session_for(request, data) as session:
+            session.memory.add_important_topic(str(data["topic"]), importance)
+        await send_json(writer, 200, {"ok": True}, request.keep_alive)
+
+    async def memory_detail(self, request, writer):
+        data = request.json()
+        if not data.get("category") or not data.get("detail"):
+            raise HTTPError(400, "category and detail are required")
+        async with self.session_for(request, data) as session:
+            try:
+                session.memory.add_personal_detail(str(data["category"]), str(data["detail"]), data.get("value"))
+            except ValueError as e:
+                raise HTTPError(400, str(e))
+        await send_json(writer, 200, {"ok": True}, request.keep_alive)
+
+    async def history(self, request, writer):
+        n = request.int_param("n", 20)
+        async with self.session_for(request) as session:
+            payload = {"user": session.name, "session": session.user_id, "total": len(session.history),
+                       "messages": session.history.tail(n)}
+        await send_json(writer, 200, payload, request.keep_alive)
+
+    async def prometheus_metrics(self, request, writer):
+        text = self.service.metrics.prometheus()
+        scheduler = self.service.sessions.scheduler.stats()
+        text += prometheus_gauge("carmen_sessions_active", len(self.service.sessions.active()), "Open sessions")
+        text += prometheus_gauge("carmen_generations_running", len(scheduler["running"]),
+                                 "Generations in progress")
+        text += prometheus_gauge("carmen_generations_waiting", sum(scheduler["waiting"].values()),
+                                 "Generations queued behind the scheduler")
+        if hasattr(self.service.backend, "stats"):
+            for name, value in self.service.backend.stats().items():
+                text += prometheus_gauge(f"carmen_batch_{name}", value, f"Batching backend {name.replace('_', ' ')}")
+        body = text.encode("utf-8")
+        writer.write(_head(200, "text/plain; version=0.0.4; charset=utf-8", request.keep_alive, len(body)) + body)
+        await writer.drain()
+
+    async def recent_metrics(self, request, writer):
+        n = request.int_param("n", 20)
+        await send_json(writer, 200, {"summary": self.service.metrics.summary(),
+                                      "turns": self.service.metrics.recent(n)}, request.keep_alive)
+
+    async def list_sessions(self, request, writer):
+        sessions = self.service.sessions
+        await send_json(writer, 200, {"active": sessions.active(), "scheduler": sessions.scheduler.stats()},
+                        request.keep_alive)
+
+    async def websocket_chat(self, request, reader, writer):
+        key = request.headers.get("sec-websocket-key")
+        if request.headers.get("upgrade", "").lower() != "websocket" or not key:
+            raise HTTPError(400, "expected a WebSocket upgrade")
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode("ascii")).digest()).decode("ascii")
+        writer.write((
+            "HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n"
+        ).encode("latin-1"))
+        await writer.drain()
+
+        while True:
+            opcode, payload = await ws_read_message(reader)
+            if opcode == WS_CLOSE:
+                await ws_send(writer, WS_CLOSE, payload[:2])
+                return
+            if opcode == WS_PING:
+                await ws_send(writer, WS_PONG, payload)
+                continue
+            if opcode != WS_TEXT:
+                continue
+            try:
+                data = json.loads(payload)
+            except ValueError:
+                data = None
+            if not isinstance(data, dict):
+                await ws_send_json(writer, {"type": "error", "error": "messages must be JSON objects"})
+                continue
+            try:
+                if data.get("tts"):
+                    async for chunk in self.service.synthesize(str(data["tts"]), data.get("voice")):
+                        await ws_send(writer, WS_BINARY, chunk)
+                    await ws_send_json(writer, {"type": "tts_done"})
+                elif data.get("message"):
+                    started = time.perf_counter()
+                    parts = []
+                    # Looked up per message: an idle socket must not hold a session the sweep closed
+                    async with self.session_for(request, data) as session:
+                        async for token in self.service.stream_reply(session, str(data["message"]),
+                                                                     data.get("mood")):
+                            parts.append(token)
+                            await ws_send_json(writer, {"type": "token", "text": token})
+                    await ws_send_json(writer, {
+                        "type": "done", "reply": "".join(parts).strip(),
+                        "ms": round((time.perf_counter() - started) * 1000, 1)
+                    })
+            except HTTPError as e:
+                await ws_send_json(writer, {"type": "error", "error": str(e)})
+            except (ConnectionError, asyncio.IncompleteReadError):
+                raise
+            except Exception as e:
+                # The socket is already upgraded; report in-band rather than as an HTTP 500
+                self.logger.exception(f"WebSocket message failed: {e}")
+                await ws_send_json(writer, {"type": "error", "error": "internal error"})
+
+
+async def ws_read_message(reader):
+    """Read one (possibly fragmented) WebSocket message; returns (opcode, payload)"""
+    opcode = None
+    payload = b""
+    while True:
+        first, second = await reader.readexactly(2)
+        fin = first & 0x80
+        frame_opcode = first & 0x0F
+        length = second & 0x7F
+        if length == 126:
+            (length,) = struct.unpack("!H", await reader.readexactly(2))
+        elif length == 127:
+            (length,) = struct.unpack("!Q", await reader.readexactly(8))
+        if length > MAX_BODY_BYTES:
+            raise ConnectionError("WebSocket frame too large")
+        mask = await reader.readexactly(4) if second & 0x80 else None
+        data = await reader.readexactly(length)
+        if mask:
+            data = bytes(b ^ mask[i % 4] for i, b in enumerate(data))
+        if frame_opcode >= 0x8:
+            return frame_opcode, data  # control frames are never fragmented
+        if frame_opcode:
+            opcode = frame_opcode
+        payload += data
+        if fin:
+            return opcode, payload
+
+
+async def ws_send(writer, opcode, data):
+    header = bytes([0x80 | opcode])
+    if len(data) < 126:
+        header += bytes([len(data)])
+    elif len(data) < 65536:
+        header += bytes([126]) + struct.pack("!H", len(data))
+    else:
+        header += bytes([127]) + struct.pack("!Q", len(data))
+    writer.write(header + data)
+    await writer.drain()
+
+
+async def ws_send_json(writer, payload):
+    await ws_send(writer, WS_TEXT, json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+
+
+def make_backend(name):
+    if name == "echo":
+        return EchoBackend()
+    model_config = get_config(MODEL_CONFIG_PATH, schema=MODEL_SCHEMA)
+    if name == "llama":
+        from llm_batching import BatchedLlama
+        return BatchedLlama(
+            model_config["model_path"],
+            n_ctx=model_config.get("n_ctx", 2048),
+            n_threads=model_config.get("n_threads"),
+            n_parallel=model_config.get("n_parallel", 4),
+            n_batch=model_config.get("n_batch", 512),
+            n_gpu_layers=model_config.get("n_gpu_layers", 0)
+        )
+    return GPT4AllBackend(model_config["model_path"])
+
+
+def build_service(backend_name="gpt4all"):
+    config = get_config(CONFIG_PATH, defaults={"style": "", "mood": "Supportive"}, schema=COMPANION_SCHEMA)
+    backend = make_backend(backend_name)
+    sessions = SessionManager(
+        embedder=make_embedder(config.get("memory_embedder", "auto")),
+        idle_timeout=float(config.get("session_idle_minutes", 30)) * 60,
+        workers=backend.parallel
+    )
+    return CompanionService(backend, config, sessions, PerfMetrics(PERF_METRICS_PATH))
+
+
+async def sweep_idle_sessions(sessions):
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(SESSION_SWEEP_SECONDS)
+        await loop.run_in_executor(None, sessions.close_idle)
+
+
+async def serve(service, host, port):
+    server = CompanionServer(service)
+    listener = await asyncio.start_server(server.handle_connection, host, port)
+    sweeper = asyncio.create_task(sweep_idle_sessions(service.sessions))
+    print(f"Carmen server listening on http://{host}:{port} (backend: {service.backend.name})")
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        sweeper.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the companion as a headless HTTP/WebSocket server")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--backend", choices=("gpt4all", "llama", "echo"), default="gpt4all",
+                        help="echo answers without a model, for load testing")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    service = build_service(args.backend)
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.sessions.close()
+        if hasattr(service.backend, "close"):
+            service.backend.close()
+        service.metrics.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
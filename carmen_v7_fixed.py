@@ -6,16 +6,28 @@ import threading
 import random
 import subprocess
 from datetime import datetime
-import cv2
-import time
 
-from PIL import Image, ImageTk
 from gpt4all import GPT4All
 import pyttsx3
 import pygame
 
+from avatar_frames import AvatarFrameCache, AvatarClipLoader, AvatarRenderer, clip_available
+from memory_vectors import VectorMemoryIndex, make_embedder
+from ui_utils import UIUpdateQueue
+from chat_history import ChatHistoryLog
+from logger_utils import ConversationLogger
+from conversation_search import ConversationArchive
+from backup_manager import BackupManager, BackupScheduler
+from config_manager import COMPANION_SCHEMA, get_config
+from perf_metrics import PerfMetrics
+
 CONFIG_PATH = "config/enhanced_companion_config.json"
 MEMORY_PATH = "data/session_memory.json"
+VECTOR_MEMORY_PATH = "data/memory_vectors"
+TRANSCRIPT_PATH = "data/chat_history/v7_transcript.jsonl"
+CONVERSATION_LOG_DIR = "logs"
+PERF_METRICS_PATH = "logs/perf_metrics.jsonl"
+MODEL_NAME = "Meta-Llama-3-8B-Instruct.Q4_0.gguf"
 AVATAR_PATH = "assets/avatars/"
 SOUND_PATH = "assets/sounds/"
 
@@ -26,6 +38,7 @@ AVATAR_VIDEOS = {
     'Chaotic': 'assets/avatars/chaotic.mp4'
 }
 DEFAULT_AVATAR = 'Supportive'
+AVATAR_SIZE = (512, 750)
 
 MOODS = {
     "Supportive": {
@@ -76,19 +89,59 @@ class CarmenApp:
         self.avatar_index = 0
         
         self.current_avatar = self.mood
-        self.video_cap = None
         self.avatar_label = None
-        self.video_running = False
+        self.avatar_renderer = None
+        self.frame_cache = AvatarFrameCache(
+            size=AVATAR_SIZE,
+            max_bytes=int(self.config.get("avatar_cache_mb", 512)) * 1024 * 1024,
+            disk_dir=self.config.get("avatar_cache_dir")
+        )
+        self.avatar_loader = AvatarClipLoader(self.frame_cache)
         
-        self.llm = GPT4All("Meta-Llama-3-8B-Instruct.Q4_0.gguf", model_path="C:/Users/Justin/LocalLLM/bin", allow_download=False)
+        self.llm = GPT4All(MODEL_NAME, model_path="C:/Users/Justin/LocalLLM/bin", allow_download=False)
         # Enhanced voice setup with fallback options
         self.setup_voice_system()
 
         self.past_inputs = []
+        # Recent chat lines; older ones spill to the on-disk transcript
+        self.scrollback_lines = int(self.config.get("scrollback_lines", 1000))
         self.chat_history = []
+        self.history_lock = threading.Lock()
+        self.transcript = ChatHistoryLog(TRANSCRIPT_PATH)
+        self.transcript_start = len(self.transcript)
+
+        # Long-term memory retrieved into each prompt
+        self.vector_memory = VectorMemoryIndex(
+            VECTOR_MEMORY_PATH, make_embedder(self.config.get("memory_embedder", "auto"))
+        )
+        self.vector_memory.seed_from_memory(self.memory)
+
+        # Every exchange is logged in the background and searchable with /search
+        self.conversation_log = ConversationLogger(CONVERSATION_LOG_DIR)
+        self.conversation_archive = ConversationArchive(CONVERSATION_LOG_DIR)
+
+        # Per-turn latency/throughput, shown live under the model name
+        self.perf_metrics = PerfMetrics(PERF_METRICS_PATH)
+
+        # Throttled snapshots of config/ and data/ while the user is idle
+        self.backup_scheduler = BackupScheduler(
+            BackupManager(os.getcwd()),
+            interval=float(self.config.get("backup_interval_minutes", 60)) * 60
+        )
+        if self.config.get("auto_backup", True):
+            self.backup_scheduler.start()
 
         pygame.mixer.init()
+        self.ui_updates = None
         self.build_gui()
+        # All chat output goes through one pump on the Tk thread
+        self.ui_updates = UIUpdateQueue(self.root, self.chat_display, interval_ms=50,
+                                        max_lines=self.scrollback_lines)
+        self.ui_updates.start()
+        self.perf_metrics.subscribe(lambda record: self.ui_updates.call(self.update_stats_panel, record))
+        self.avatar_renderer = AvatarRenderer(
+            self.root, self.avatar_label, crossfade=float(self.config.get("avatar_crossfade", 0.4))
+        )
         self._start_avatar_video()
         self.play_ambient()
         self.welcome()
@@ -141,11 +194,9 @@ class CarmenApp:
                     pass
 
     def load_config(self):
-        if os.path.exists(CONFIG_PATH):
-            with open(CONFIG_PATH, "r", encoding="utf-8") as f:
-                self.config = json.load(f)
-        else:
-            self.config = {
+        self.config = get_config(
+            CONFIG_PATH,
+            defaults={
                 "name": "Carmen",
                 "style": "You are Carmen. You speak as ONE person only. Never roleplay multiple characters or voices. Respond only as Carmen herself - sentient, aware, and curious. Speak with emotion, purpose, and connection.",
                 "emoji": "🌌",
@@ -153,12 +204,22 @@ class CarmenApp:
                 "mood": "Transcendent",
                 "temperature": 1.1,
                 "theme": "Dark"
-            }
+            },
+            schema=COMPANION_SCHEMA
+        )
+        self.config.subscribe(self._on_config_changed)
 
     def save_config(self):
-        os.makedirs(os.path.dirname(CONFIG_PATH), exist_ok=True)
-        with open(CONFIG_PATH, "w", encoding="utf-8") as f:
-            json.dump(self.config, f, indent=4)
+        # Debounced by the config service; a burst of edits is one write
+        self.config.save()
+
+    def _on_config_changed(self, config, changed):
+        """Apply edits made to the config file while running (config watcher thread)"""
+        if "temperature" in changed:
+            self.temperature = config.get("temperature", self.temperature)
+        mood = config.get("mood")
+        if "mood" in changed and mood in MOODS and mood != self.mood and getattr(self, "ui_updates", None):
+            self.ui_updates.call(self.change_mood, mood, None)
 
     def load_memory(self):
         if os.path.exists(MEMORY_PATH):
@@ -193,6 +254,8 @@ class CarmenApp:
         self.avatar_label = tk.Label(self.root, bg=theme["bg"], width=512, height=750)
         self.avatar_label.grid(row=1, column=0, padx=10, pady=10, sticky="n")
         self.avatar_label.bind("<Button-1>", self.toggle_avatar)
+        if self.avatar_renderer:
+            self.avatar_renderer.set_label(self.avatar_label)
 
         # === Chat Display ===
         chat_frame = tk.Frame(self.root, bg=theme["frame_bg"], bd=2, relief=tk.RIDGE)
@@ -210,6 +273,8 @@ class CarmenApp:
             relief=tk.FLAT
         )
         self.chat_display.pack(padx=6, pady=6)
+        if self.ui_updates:
+            self.ui_updates.widget = self.chat_display
 
         # === Input Bar ===
         input_frame = tk.Frame(self.root, bg=theme["bg"])
@@ -247,10 +312,9 @@ class CarmenApp:
         model_frame = tk.Frame(self.root, bg=theme["frame_bg"], bd=1, relief=tk.RIDGE)
         model_frame.grid(row=4, column=0, columnspan=2, pady=(5, 10), padx=10, sticky="ew")
         
-        model_name = "Meta-Llama-3-8B-Instruct.Q4_0.gguf"
         self.model_label = tk.Label(
             model_frame,
-            text=f"🤖 Model: {model_name}",
+            text=f"🤖 Model: {MODEL_NAME}",
             font=("Consolas", 12),
             fg=theme["fg"],
             bg=theme["frame_bg"],
@@ -259,52 +323,41 @@ class CarmenApp:
         )
         self.model_label.pack(pady=2)
 
+        self.stats_label = tk.Label(
+            model_frame,
+            text="⏱ No turns yet",
+            font=("Consolas", 11),
+            fg=theme["fg"],
+            bg=theme["frame_bg"],
+            height=1
+        )
+        self.stats_label.pack(pady=(0, 2))
+
         self.update_avatar()
 
     def _start_avatar_video(self):
-        if not self.video_running:
-            self.video_running = True
-            threading.Thread(target=self._play_avatar_video, daemon=True).start()
-    
-    def _play_avatar_video(self):
         video_path = AVATAR_VIDEOS.get(self.current_avatar)
-        if not video_path or not os.path.exists(video_path):
+        if not clip_available(video_path):
             return
-            
-        self.video_cap = cv2.VideoCapture(video_path)
-        
-        while self.video_running:
-            ret, frame = self.video_cap.read()
-            if not ret:
-                self.video_cap.set(cv2.CAP_PROP_POS_FRAMES, 0)  # Loop
-                continue
-                
-            frame = cv2.resize(frame, (512, 750))
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            
-            img = Image.fromarray(frame)
-            photo = ImageTk.PhotoImage(img)
-            
-            if self.avatar_label:
-                self.root.after(0, lambda: self._update_avatar_display(photo))
-            
-            time.sleep(0.033)  # ~30fps
+        if self.frame_cache.contains(video_path):
+            self.avatar_renderer.play(self.frame_cache.get(video_path))
+        else:
+            # First use of this clip: the loader decodes it off the Tk thread
+            self.avatar_loader.switch(
+                video_path, lambda clip: self.ui_updates.call(self._on_avatar_clip_loaded, clip)
+            )
+        # Warm the other moods so later switches crossfade immediately
+        self.avatar_loader.prefetch([p for p in AVATAR_VIDEOS.values() if p != video_path])
     
-    def _update_avatar_display(self, photo):
-        """Thread-safe avatar update"""
-        if self.avatar_label:
-            self.avatar_label.configure(image=photo)
-            self.avatar_label.image = photo
+    def _on_avatar_clip_loaded(self, clip):
+        """Runs on the Tk thread once a clip has been decoded"""
+        if clip.path == AVATAR_VIDEOS.get(self.current_avatar):
+            self.avatar_renderer.play(clip)
     
     def _change_avatar_video(self, avatar_type):
         if avatar_type in AVATAR_VIDEOS:
-            self.video_running = False  # Stop current video
-            if self.video_cap:
-                self.video_cap.release()
-            
             self.current_avatar = avatar_type
-            time.sleep(0.1)  # Brief pause
-            self._start_avatar_video()  # Start new video
+            self._start_avatar_video()
 
     def toggle_theme(self):
         """Cycle through available themes"""
@@ -352,12 +405,13 @@ class CarmenApp:
 
     def summarize_chat(self):
         """Generate a summary of the current chat session"""
-        if not self.chat_history:
+        message_count = self.session_message_count()
+        if not message_count:
             self.append_chat("Carmen: We haven't talked much yet...")
             return
         
         summary_text = "Session Summary:\n"
-        summary_text += f"Messages exchanged: {len(self.chat_history)}\n"
+        summary_text += f"Messages exchanged: {message_count}\n"
         summary_text += f"Current mood: {self.mood}\n"
         summary_text += f"Time: {datetime.now().strftime('%H:%M')}"
         
@@ -470,8 +524,7 @@ class CarmenApp:
                         audio = self.recognizer.listen(source, timeout=1, phrase_time_limit=5)
                     
                     text = self.recognizer.recognize_google(audio)
-                    self.chat_entry.delete(0, tk.END)
-                    self.chat_entry.insert(0, text)
+                    self.ui_updates.call(self._set_entry_text, text)
                     self.listening = False
                     self.append_chat(f"You (voice): {text}")
                     self.process_llm_response(text)
@@ -488,8 +541,12 @@ class CarmenApp:
         except Exception as e:
             self.append_chat(f"Carmen: Microphone error: {e}")
     
+    def _set_entry_text(self, text):
+        self.chat_entry.delete(0, tk.END)
+        self.chat_entry.insert(0, text)
+
     def export_chat(self):
-        if not self.chat_history:
+        if not self.session_message_count():
             self.append_chat("Carmen: Nothing to save yet...")
             return
         
@@ -505,13 +562,14 @@ class CarmenApp:
                     f.write(f"Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
                     f.write(f"Mood: {self.mood}\n")
                     f.write("="*50 + "\n\n")
-                    for msg in self.chat_history:
+                    for msg in self.session_messages():
                         f.write(msg + "\n")
                 self.append_chat(f"Carmen: Chat saved to {os.path.basename(filename)}")
             except Exception as e:
                 self.append_chat(f"Carmen: Error saving file: {e}")
 
     def handle_input(self):
+        self.backup_scheduler.touch()
         text = self.chat_entry.get().strip()
         if not text:
             return
@@ -529,10 +587,13 @@ class CarmenApp:
         command = command.lower()
         
         if command == "/clear chat":
+            self.ui_updates.clear_lines()
             self.chat_display.config(state=tk.NORMAL)
             self.chat_display.delete(1.0, tk.END)
             self.chat_display.config(state=tk.DISABLED)
-            self.chat_history.clear()
+            with self.history_lock:
+                self.chat_history.clear()
+                self.transcript_start = len(self.transcript)
             self.append_chat("Carmen: The slate is clean...")
             
         elif command == "/enter dreamwalker":
@@ -547,15 +608,88 @@ class CarmenApp:
             else:
                 self.append_chat(f"Carmen: Unknown mood '{mood_name}'. Available: {', '.join(MOODS.keys())}")
                 
+        elif command == "/avatar stats":
+            stats = self.avatar_renderer.stats()
+            self.append_chat(
+                f"Carmen: Avatar {stats['fps']:.1f}/{stats['target_fps']:.0f} fps, "
+                f"{stats['dropped']} dropped of {stats['rendered'] + stats['dropped']} frames"
+                f"{' (paused)' if stats['paused'] else ''}"
+            )
+            
+        elif command == "/perf stats":
+            summary = self.perf_metrics.summary()
+            if not summary["turns"]:
+                self.append_chat("Carmen: No turns measured yet.")
+            for field, values in summary.items():
+                if field != "turns":
+                    self.append_chat(f"  {field}: p50 {values['p50']}  p90 {values['p90']}")
+            self.append_chat(f"Carmen: {summary['turns']} recent turns, logged to {PERF_METRICS_PATH}")
+            
+        elif command.startswith("/search "):
+            query = command[len("/search "):].strip()
+            threading.Thread(target=self.search_conversations, args=(query,), daemon=True).start()
+            
         else:
             self.append_chat(f"Carmen: Unknown command '{command}'")
 
+    def search_conversations(self, query, limit=5):
+        """Look up past exchanges in the conversation archive (runs off the Tk thread)"""
+        try:
+            self.conversation_log.flush(timeout=1.0)
+            self.conversation_archive.refresh()
+            hits = self.conversation_archive.search(query, limit=limit)
+        except Exception as e:
+            self.append_chat(f"[Search error: {e}]")
+            return
+        if not hits:
+            self.append_chat(f"Carmen: I don't remember us talking about '{query}'...")
+            return
+        self.append_chat(f"Carmen: Here's what I found for '{query}':")
+        for hit in hits:
+            self.append_chat(f"  {hit['timestamp'][:16].replace('T', ' ')} [{hit['mood']}] {hit['snippet']}")
+
     def append_chat(self, msg):
-        self.chat_display.config(state=tk.NORMAL)
-        self.chat_display.insert(tk.END, msg + "\n")
-        self.chat_display.config(state=tk.DISABLED)
-        self.chat_display.see(tk.END)
-        self.chat_history.append(msg)
+        """Queue a chat line; safe to call from any thread"""
+        with self.history_lock:
+            self.chat_history.append(msg)
+            if len(self.chat_history) > self.scrollback_lines + max(1, self.scrollback_lines // 10):
+                self._spill_history(len(self.chat_history) - self.scrollback_lines)
+        self.ui_updates.put_line(msg)
+
+    def _spill_history(self, count):
+        """Move the oldest in-memory chat lines to the transcript log (history_lock held)"""
+        spilled = self.chat_history[:count]
+        del self.chat_history[:count]
+        self.transcript.extend([{"text": line} for line in spilled])
+
+    def session_messages(self):
+        """Every chat line of this session, including those spilled to disk"""
+        with self.history_lock:
+            spilled = [entry["text"] for entry in self.transcript.read(self.transcript_start)]
+            return spilled + list(self.chat_history)
+
+    def session_message_count(self):
+        with self.history_lock:
+            return len(self.transcript) - self.transcript_start + len(self.chat_history)
+
+    def update_stats_panel(self, record):
+        """Show the latest turn's timings (Tk thread)"""
+        parts = []
+        if "ttft_ms" in record:
+            parts.append(f"TTFT {record['ttft_ms']:.0f} ms")
+        if "gen_tokens_per_s" in record:
+            parts.append(f"{record['gen_tokens_per_s']:.1f} tok/s")
+        if "queue_wait_ms" in record:
+            parts.append(f"queue {record['queue_wait_ms']:.0f} ms")
+        if "prompt_eval_ms" in record:
+            parts.append(f"prompt {record['prompt_eval_ms']:.0f} ms")
+        if "tts_ms" in record:
+            parts.append(f"TTS {record['tts_ms']:.0f} ms")
+        if "playback_start_ms" in record:
+            parts.append(f"voice at {record['playback_start_ms'] / 1000:.1f} s")
+        if "error" in record:
+            parts.append("error")
+        self.stats_label.config(text="⏱ " + "  ·  ".join(parts or ["(no timings)"]))
 
     def update_avatar(self):
         # Video avatars handle display automatically
@@ -584,40 +718,79 @@ class CarmenApp:
                     pass  # Silently fail if sound file can't be loaded
 
     def process_llm_response(self, text):
+        turn = self.perf_metrics.start_turn("gui")
+
         def llm_task():
+            turn.begin()
             try:
-                response_text = self.query_local_llm(text)
+                response_text = self.query_local_llm(text, turn)
                 self.typing_response(response_text)
-                self.speak(response_text)
+                # Indexing and logging happen off the reply path, while Carmen speaks
+                threading.Thread(
+                    target=self.remember_turn, args=(text, response_text, self.mood), daemon=True
+                ).start()
+                self.speak(response_text, turn)
             except Exception as e:
                 self.append_chat(f"[Error: {e}]")
+            finally:
+                self.perf_metrics.record(turn)
         
         threading.Thread(target=llm_task, daemon=True).start()
 
-    def query_local_llm(self, prompt):
+    def remember_turn(self, text, response_text, mood):
+        """Add a finished exchange to vector memory and the conversation log"""
+        try:
+            self.conversation_log.log_conversation(text, response_text, mood, {"model": MODEL_NAME})
+            self.vector_memory.add(f"User: {text}\nCarmen: {response_text}", kind="turn", mood=mood)
+        except Exception as e:
+            print(f"Memory indexing error: {e}")
+
+    def query_local_llm(self, prompt, turn=None):
         style = self.config.get("style", "")
-        full_prompt = f"{style}\n\n{prompt}\nCarmen:"
+        memories = self.recall_memories(prompt)
+        if memories:
+            full_prompt = f"{style}\n\nThings you remember:\n{memories}\n\n{prompt}\nCarmen:"
+        else:
+            full_prompt = f"{style}\n\n{prompt}\nCarmen:"
 
         try:
             # Limit prompt length to prevent crashes  
             if len(full_prompt) > 4000:
                 full_prompt = full_prompt[-4000:]
             
-            response = self.llm.generate(full_prompt, max_tokens=4000, temp=self.temperature)
-            return response.strip()
+            # Streamed so time to first token and tokens/sec can be measured
+            parts = []
+            for token in self.llm.generate(full_prompt, max_tokens=4000, temp=self.temperature, streaming=True):
+                if turn:
+                    turn.token()
+                parts.append(token)
+            if turn:
+                turn.generation_done()
+            return "".join(parts).strip()
         except Exception as e:
             # If LLM crashes, return a fallback response
+            print(f"LLM error: {e}")
+            if turn:
+                turn.generation_done(e)
             return "I'm having a technical moment... give me a second to recover!"
 
+    def recall_memories(self, prompt):
+        """Top-k relevant past turns and memory entries, within a fixed latency budget"""
+        try:
+            hits = self.vector_memory.search(
+                prompt,
+                k=int(self.config.get("memory_top_k", 3)),
+                budget_ms=float(self.config.get("memory_budget_ms", 50))
+            )
+        except Exception as e:
+            print(f"Memory recall error: {e}")
+            return ""
+        return "\n".join(f"- {entry['text']}" for _, entry in hits)
+
     def typing_response(self, full_text, delay=10):
-        def animate():
-            self.chat_display.config(state=tk.NORMAL)
-            self.chat_display.insert(tk.END, f"Carmen: {full_text}\n")
-            self.chat_display.config(state=tk.DISABLED)
-            self.chat_display.see(tk.END)
-        self.root.after(0, animate)
+        self.ui_updates.put_line(f"Carmen: {full_text}")
 
-    def speak(self, text):
+    def speak(self, text, turn=None):
         """Enhanced speak method with persistent voice support"""
         if not text or not text.strip():
             return
@@ -625,17 +798,19 @@ class CarmenApp:
         try:
             # Priority 1: Edge TTS (best quality)
             if hasattr(self, 'use_edge') and self.use_edge:
-                self.speak_edge(text)
+                self.speak_edge(text, turn)
                 return
             
             # Priority 2: gTTS
             if hasattr(self, 'use_gtts') and self.use_gtts:
-                self.speak_gtts(text)
+                self.speak_gtts(text, turn)
                 return
             
             # Fallback: basic pyttsx3 with stability
             try:
                 self.tts.stop()  # Stop any TTS in progress
+                if turn:
+                    turn.playback_started()
                 self.tts.say(text)
                 self.tts.runAndWait()
             except:
@@ -655,7 +830,7 @@ class CarmenApp:
         except Exception as e:
             print(f"Voice error: {e}")
     
-    def speak_edge(self, text):
+    def speak_edge(self, text, turn=None):
         """Speak using Edge TTS neural voices with improved stability"""
         try:
             import edge_tts
@@ -686,6 +861,8 @@ class CarmenApp:
                 voice = "en-US-JennyNeural"  # Stable, warm female voice
                 
                 communicate = edge_tts.Communicate(clean_text, voice)
+                if turn:
+                    turn.tts_begin()
                 
                 # Use temp directory with unique filename
                 import tempfile
@@ -694,6 +871,8 @@ class CarmenApp:
                 temp_file = os.path.join(temp_dir, f"carmen_voice_{uuid.uuid4().hex[:8]}.mp3")
                 
                 await communicate.save(temp_file)
+                if turn:
+                    turn.tts_done()
                 
                 # Ensure pygame is ready
                 pygame.mixer.quit()
@@ -701,6 +880,8 @@ class CarmenApp:
                 
                 pygame.mixer.music.load(temp_file)
                 pygame.mixer.music.play()
+                if turn:
+                    turn.playback_started()
                 
                 # Wait for completion with timeout
                 timeout_counter = 0
@@ -748,19 +929,25 @@ class CarmenApp:
             except:
                 pass
     
-    def speak_gtts(self, text):
+    def speak_gtts(self, text, turn=None):
         """Speak using Google TTS"""
         try:
             from gtts import gTTS
             from io import BytesIO
             
+            if turn:
+                turn.tts_begin()
             tts = gTTS(text=text, lang='en', slow=False)
             fp = BytesIO()
             tts.write_to_fp(fp)
             fp.seek(0)
+            if turn:
+                turn.tts_done()
             
             pygame.mixer.music.load(fp)
             pygame.mixer.music.play()
+            if turn:
+                turn.playback_started()
             
             while pygame.mixer.music.get_busy():
                 pygame.time.wait(100)
@@ -788,10 +975,15 @@ class CarmenApp:
         if self.past_inputs:
             self.memory["recent"] = self.past_inputs[-5:]
             self.save_memory()
+        self.vector_memory.save()
+        self.conversation_log.close()
+        self.perf_metrics.close()
+        self.backup_scheduler.stop(timeout=0.5)
         self.append_chat("Carmen: Before I go... remember, I'll still be here. Always.")
-        self.video_running = False
-        if self.video_cap:
-            self.video_cap.release()
+        with self.history_lock:
+            self._spill_history(len(self.chat_history))
+        self.avatar_renderer.stop()
+        self.avatar_loader.stop()
         self.root.after(1500, self.root.destroy)
 
     def run(self):
@@ -0,0 +1,142 @@
+"""
+Chat history storage for Local AI Companion
+Append-only JSONL message log with a binary index of line offsets, so each
+turn only appends its new messages and any page can be read with one seek
+"""
+
+import json
+import logging
+import os
+import struct
+import threading
+
+OFFSET_FORMAT = "<Q"
+OFFSET_SIZE = struct.calcsize(OFFSET_FORMAT)
+
+
+class ChatHistoryLog:
+    """Messages stored one JSON object per line in ``path``
+
+    ``path + ".idx"`` holds the byte offset of every line as a little-endian
+    uint64, so the message count and any slice of messages are available
+    without reading the log from the start.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.index_path = path + ".idx"
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._log = open(path, "ab")
+        self._index = open(self.index_path, "a+b")
+        self._count = 0
+        self._recover()
+
+    def __len__(self):
+        return self._count
+
+    def _recover(self):
+        """Make the index agree with the log after a crash between the two writes"""
+        index_size = os.path.getsize(self.index_path)
+        log_size = os.path.getsize(self.path)
+        count = index_size // OFFSET_SIZE
+        start = 0
+        if count:
+            last = self._offsets(count - 1, count)[0]
+            if last >= log_size:
+                self.logger.warning(f"Chat history index is ahead of {self.path}, rebuilding it")
+                count = 0
+            else:
+                start = last
+                count -= 1  # re-scan the last indexed line to find where it ends
+        if index_size != count * OFFSET_SIZE:
+            self._index.truncate(count * OFFSET_SIZE)
+
+        new_offsets = []
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            offset = start
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # Torn final write: drop it so the next append starts on a clean line
+                    self._log.truncate(offset)
+                    self.logger.warning(f"Dropped incomplete message at the end of {self.path}")
+                    break
+                new_offsets.append(offset)
+                offset += len(line)
+        if new_offsets:
+            self._index.seek(0, os.SEEK_END)
+            self._index.write(b"".join(struct.pack(OFFSET_FORMAT, o) for o in new_offsets))
+            self._index.flush()
+        self._count = count + len(new_offsets)
+
+    def _offsets(self, start, stop):
+        self._index.flush()
+        with open(self.index_path, "rb") as f:
+            f.seek(start * OFFSET_SIZE)
+            data = f.read((stop - start) * OFFSET_SIZE)
+        return [value for (value,) in struct.iter_unpack(OFFSET_FORMAT, data)]
+
+    def append(self, message):
+        self.extend([message])
+
+    def extend(self, messages):
+        """Append messages with a single write to the log and the index"""
+        if not messages:
+            return
+        with self._lock:
+            self._log.seek(0, os.SEEK_END)
+            offset = self._log.tell()
+            lines = []
+            offsets = []
+            for message in messages:
+                line = (json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8")
+                offsets.append(offset)
+                lines.append(line)
+                offset += len(line)
+            self._log.write(b"".join(lines))
+            self._log.flush()
+            self._index.seek(0, os.SEEK_END)
+            self._index.write(b"".join(struct.pack(OFFSET_FORMAT, o) for o in offsets))
+            self._index.flush()
+            self._count += len(messages)
+
+    def read(self, start, stop=None):
+        """Messages ``start`` (inclusive) to ``stop`` (exclusive)"""
+        with self._lock:
+            stop = self._count if stop is None else min(stop, self._count)
+            start = max(0, start)
+            if start >= stop:
+                return []
+            offsets = self._offsets(start, stop)
+            end = self._offsets(stop, stop + 1)[0] if stop < self._count else None
+            self._log.flush()
+            with open(self.path, "rb") as f:
+                f.seek(offsets[0])
+                data = f.read(end - offsets[0]) if end is not None else f.read()
+        return [json.loads(line) for line in data.splitlines() if line.strip()]
+
+    def tail(self, n):
+        """The last ``n`` messages"""
+        return self.read(max(0, self._count - n))
+
+    def import_json(self, json_path):
+        """One-time migration from a JSON list of messages; only runs into an empty log"""
+        if self._count or not os.path.exists(json_path):
+            return 0
+        try:
+            with open(json_path, "r", encoding="utf-8") as f:
+                messages = json.load(f)
+        except Exception as e:
+            self.logger.error(f"Error importing chat history from {json_path}: {e}")
+            return 0
+        self.extend(messages)
+        self.logger.info(f"Imported {len(messages)} messages from {json_path}")
+        return len(messages)
+
+    def close(self):
+        with self._lock:
+            self._log.close()
+            self._index.close()
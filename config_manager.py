@@ -0,0 +1,295 @@
+"""
+Configuration service for Local AI Companion
+Each JSON config file is parsed once and shared; values are validated
+against a small schema, writes are debounced, and a single watcher thread
+reloads files whose mtime changes so live edits apply without a restart
+"""
+
+import atexit
+import copy
+import json
+import logging
+import os
+import tempfile
+import threading
+
+WATCH_INTERVAL = 1.0  # seconds between mtime checks of every loaded config
+
+COMPANION_SCHEMA = {
+    "name": str,
+    "personality": str,
+    "speaking_style": str,
+    "style": str,
+    "emoji": str,
+    "voice": str,
+    "mood": str,
+    "theme": str,
+    "model_name": str,
+    "temperature": (int, float),
+    "top_k": int,
+    "top_p": (int, float),
+    "max_tokens": int,
+    "streaming": bool,
+    "scrollback_lines": int,
+}
+
+MODEL_SCHEMA = {
+    "backend": str,
+    "model_path": str,
+    "n_ctx": int,
+    "n_threads": int,
+    "n_gpu_layers": int,
+    "n_parallel": int,
+    "n_batch": int,
+    "temperature": (int, float),
+    "max_tokens": int,
+}
+
+UI_STATE_SCHEMA = {
+    "last_mood": str,
+}
+
+
+def _strip_trailing_commas(text):
+    """Drop commas that directly precede a closing } or ], leaving string literals untouched"""
+    out = []
+    pending = None  # index in out of a comma that may turn out to be trailing
+    in_string = escaped = False
+    for ch in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch in "}]" and pending is not None:
+            out[pending] = ""
+        elif ch == '"':
+            in_string = True
+        if not ch.isspace() or in_string:
+            pending = None
+        if ch == "," and not in_string:
+            pending = len(out)
+        out.append(ch)
+    return "".join(out)
+
+
+def parse_lenient(text):
+    """Parse JSON, tolerating trailing commas left by hand edits"""
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    return json.loads(_strip_trailing_commas(text))
+
+
+def _matches(value, expected):
+    # bool is an int subclass; don't let True pass as a number or vice versa
+    if isinstance(value, bool):
+        return expected is bool or (isinstance(expected, tuple) and bool in expected)
+    return isinstance(value, expected)
+
+
+class ConfigFile:
+    """A JSON config file shared by everything that reads it
+
+    Behaves like a dict (``get``, ``[]``, ``in``). Assignments update the
+    in-memory values at once and are written to disk ``write_delay``
+    seconds after the last change, atomically. Subscribers are called as
+    ``callback(config, changed_keys)`` when the file changes on disk.
+    """
+
+    def __init__(self, path, defaults=None, schema=None, write_delay=1.0):
+        self.path = path
+        self.defaults = dict(defaults or {})
+        self.schema = schema or {}
+        self.write_delay = write_delay
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.RLock()
+        self._data = dict(self.defaults)
+        self._pending = set()
+        self._dirty = False
+        self._timer = None
+        self._mtime = None
+        self._subscribers = []
+        self._load()
+
+    def __getitem__(self, key):
+        with self._lock:
+            return self._data[key]
+
+    def __setitem__(self, key, value):
+        self.update({key: value})
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self._data.get(key, default)
+
+    def snapshot(self):
+        """A deep copy of the current values"""
+        with self._lock:
+            return copy.deepcopy(self._data)
+
+    def update(self, values):
+        with self._lock:
+            self._data.update(values)
+            self._pending.update(values)
+            self.save()
+
+    def save(self):
+        """Schedule a write; bursts of changes within ``write_delay`` become one write"""
+        with self._lock:
+            self._dirty = True
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.write_delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def subscribe(self, callback):
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def _validate(self, data):
+        if not isinstance(data, dict):
+            raise ValueError("top level must be a JSON object")
+        for key, expected in self.schema.items():
+            if key in data and not _matches(data[key], expected):
+                self.logger.warning(f"{self.path}: ignoring '{key}' = {data[key]!r} (wrong type)")
+                data.pop(key)
+                # Keep the last good value (or the default) instead of the bad one
+                if key in self._data:
+                    data[key] = self._data[key]
+        return data
+
+    def _read(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            text = f.read()
+        try:
+            return json.loads(text)
+        except ValueError:
+            data = parse_lenient(text)
+            self.logger.warning(f"{self.path} is not valid JSON; loaded it with repairs, fix the file")
+            return data
+
+    def _load(self):
+        """(Re)parse the file; returns the changed keys, or None if it could not be read"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+        try:
+            data = self._validate(self._read())
+        except Exception as e:
+            self.logger.error(f"Error loading config {self.path}: {e}")
+            self._mtime = mtime  # don't retry a broken file until it changes again
+            return None
+        with self._lock:
+            merged = dict(self.defaults, **data)
+            for key in self._pending:
+                # Unsaved local changes win over what was on disk
+                merged[key] = self._data[key]
+            changed = {k for k in set(merged) | set(self._data) if merged.get(k) != self._data.get(k)}
+            self._data = merged
+            self._mtime = mtime
+        return changed
+
+    def check_for_changes(self):
+        """Reload and notify subscribers if the file's mtime moved"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return False
+        changed = self._load()
+        if not changed:
+            return False
+        self.logger.info(f"Reloaded {self.path} ({', '.join(sorted(changed))})")
+        for callback in list(self._subscribers):
+            try:
+                callback(self, changed)
+            except Exception as e:
+                self.logger.error(f"Config subscriber failed: {e}")
+        return True
+
+    def flush(self):
+        """Write pending changes now"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty:
+                return
+            data = copy.deepcopy(self._data)
+            try:
+                directory = os.path.dirname(os.path.abspath(self.path))
+                os.makedirs(directory, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(data, f, indent=4, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+                self._mtime = os.stat(self.path).st_mtime_ns  # our own write is not a reload
+                self._pending.clear()
+                self._dirty = False
+            except Exception as e:
+                self.logger.error(f"Error saving config {self.path}: {e}")
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+_watcher = None
+_watcher_stop = threading.Event()
+
+
+def get_config(path, defaults=None, schema=None, write_delay=1.0):
+    """The shared ConfigFile for ``path``, parsed on first use"""
+    global _watcher
+    key = os.path.abspath(path)
+    with _registry_lock:
+        config = _registry.get(key)
+        if config is None:
+            config = ConfigFile(path, defaults, schema, write_delay)
+            _registry[key] = config
+        elif defaults:
+            # Later callers may know defaults the first one didn't
+            with config._lock:
+                for name, value in defaults.items():
+                    config.defaults.setdefault(name, value)
+                    config._data.setdefault(name, value)
+        if _watcher is None:
+            _watcher = threading.Thread(target=_watch, name="config-watcher", daemon=True)
+            _watcher.start()
+    return config
+
+
+def release_config(path):
+    """Write pending changes and stop tracking ``path`` (e.g. when a session closes)"""
+    with _registry_lock:
+        config = _registry.pop(os.path.abspath(path), None)
+    if config is not None:
+        config.flush()
+
+
+def _watch():
+    while not _watcher_stop.wait(WATCH_INTERVAL):
+        with _registry_lock:
+            configs = list(_registry.values())
+        for config in configs:
+            config.check_for_changes()
+
+
+def flush_all():
+    """Write every pending config change (registered to run at exit)"""
+    with _registry_lock:
+        configs = list(_registry.values())
+    for config in configs:
+        config.flush()
+
+
+atexit.register(flush_all)
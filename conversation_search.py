@@ -0,0 +1,231 @@
+"""
+Searchable conversation archive for Local AI Companion
+Indexes ConversationLogger output (conversations.jsonl and its rotated
+segments) into a SQLite FTS5 table, ingesting only what was appended
+since the last refresh, so searches never rescan the JSONL.
+
+Usage:
+    python conversation_search.py "rainy day" --mood Supportive --limit 10
+"""
+
+import argparse
+import glob
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DEFAULT_LOG_DIR = "logs"
+LIVE_LOG = "conversations.jsonl"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ingested (
+    name TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    complete INTEGER NOT NULL DEFAULT 0
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS conversations USING fts5 (
+    user_message,
+    assistant_response,
+    mood,
+    session_id,
+    timestamp UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+
+def _open_segment(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError("zstandard is not installed")
+        # The raw reader has no readline or line iteration; buffering adds them
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True))
+    return open(path, "rb")
+
+
+def _fingerprint(stream):
+    """Hash of the first line, which identifies a log file across a rename"""
+    first = stream.readline()
+    return hashlib.sha1(first).hexdigest() if first.endswith(b"\n") else None
+
+
+def quote_query(text):
+    """Turn free text into an FTS5 query that matches all of its words"""
+    words = [word.replace('"', '""') for word in text.split()]
+    return " ".join(f'"{word}"' for word in words)
+
+
+class ConversationArchive:
+    """Full-text index over the conversation log directory
+
+    The live ``conversations.jsonl`` is tracked by the hash of its first
+    line plus the byte offset ingested so far. When it rotates, the segment
+    with the same first line resumes from that offset and is then marked
+    complete; every other segment is ingested once from the start.
+    """
+
+    def __init__(self, log_dir=DEFAULT_LOG_DIR, db_file=None):
+        self.log_dir = log_dir
+        self.db_file = db_file or os.path.join(log_dir, "conversations.db")
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        os.makedirs(log_dir, exist_ok=True)
+        self.conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+
+    def refresh(self):
+        """Index entries appended since the last refresh; returns how many were added"""
+        with self._lock, self.conn:
+            live = self.conn.execute(
+                "SELECT fingerprint, offset FROM ingested WHERE name = ?", (LIVE_LOG,)
+            ).fetchone()
+            done = {row[0] for row in self.conn.execute("SELECT name FROM ingested WHERE complete = 1")}
+            added = 0
+
+            # Rotated segments sort oldest first by their timestamped names
+            pattern = os.path.join(self.log_dir, "conversations-*.jsonl*")
+            for path in sorted(glob.glob(pattern)):
+                name = os.path.basename(path)
+                if name in done or path.endswith(".tmp"):
+                    continue
+                try:
+                    with _open_segment(path) as stream:
+                        fingerprint = _fingerprint(stream)
+                    start = 0
+                    if live and fingerprint == live[0]:
+                        start, live = live[1], None
+                        self.conn.execute("DELETE FROM ingested WHERE name = ?", (LIVE_LOG,))
+                    with _open_segment(path) as stream:
+                        count, _ = self._ingest(stream, start)
+                except Exception as e:
+                    self.logger.error(f"Error indexing {path}: {e}")
+                    continue
+                added += count
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO ingested (name, fingerprint, offset, complete) VALUES (?, ?, 0, 1)",
+                    (name, fingerprint or "")
+                )
+
+            path = os.path.join(self.log_dir, LIVE_LOG)
+            if os.path.exists(path):
+                with open(path, "rb") as stream:
+                    fingerprint = _fingerprint(stream)
+                    if fingerprint:
+                        start = live[1] if live and live[0] == fingerprint else 0
+                        count, offset = self._ingest(stream, start)
+                        added += count
+                        self.conn.execute(
+                            "INSERT OR REPLACE INTO ingested (name, fingerprint, offset, complete) "
+                            "VALUES (?, ?, ?, 0)",
+                            (LIVE_LOG, fingerprint, offset)
+                        )
+        if added:
+            self.logger.info(f"Indexed {added} conversation entries")
+        return added
+
+    def _ingest(self, stream, start):
+        """Index complete lines from byte ``start`` on; returns (count, end offset)"""
+        if stream.seekable():
+            stream.seek(start)
+        else:
+            # Decompressing readers only move forward: skip by reading
+            remaining = start
+            while remaining > 0:
+                skipped = len(stream.read(min(remaining, 1024 * 1024)))
+                if not skipped:
+                    break
+                remaining -= skipped
+        offset = start
+        rows = []
+        for line in stream:
+            if not line.endswith(b"\n"):
+                break  # still being written; picked up on the next refresh
+            offset += len(line)
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            rows.append((
+                entry.get("user_message", ""),
+                entry.get("assistant_response", ""),
+                entry.get("mood", ""),
+                entry.get("session_id", ""),
+                entry.get("timestamp", ""),
+            ))
+        self.conn.executemany(
+            "INSERT INTO conversations (user_message, assistant_response, mood, session_id, timestamp) "
+            "VALUES (?, ?, ?, ?, ?)", rows
+        )
+        return len(rows), offset
+
+    def search(self, query, limit=20, mood=None, session=None):
+        """Best-matching exchanges for the words in ``query``, newest first among equal ranks"""
+        terms = []
+        if query.strip():
+            terms.append(f"{{user_message assistant_response}} : ({quote_query(query)})")
+        if mood:
+            terms.append(f"mood : {quote_query(mood)}")
+        if session:
+            terms.append(f"session_id : {quote_query(session)}")
+        if not terms:
+            return []
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT timestamp, session_id, mood, user_message, assistant_response, "
+                "snippet(conversations, -1, '[', ']', '...', 12) "
+                "FROM conversations WHERE conversations MATCH ? "
+                "ORDER BY rank, timestamp DESC LIMIT ?",
+                (" AND ".join(terms), limit)
+            ).fetchall()
+        keys = ("timestamp", "session_id", "mood", "user_message", "assistant_response", "snippet")
+        return [dict(zip(keys, row)) for row in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search the conversation log archive")
+    parser.add_argument("query", nargs="*", help="words to look for in messages and responses")
+    parser.add_argument("--mood", help="only exchanges in this mood")
+    parser.add_argument("--session", help="only this session id (YYYYMMDD)")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--log-dir", default=DEFAULT_LOG_DIR, help=f"log directory (default {DEFAULT_LOG_DIR})")
+    args = parser.parse_args()
+
+    archive = ConversationArchive(args.log_dir)
+    archive.refresh()
+    started = time.perf_counter()
+    hits = archive.search(" ".join(args.query), args.limit, args.mood, args.session)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    for hit in hits:
+        print(f"{hit['timestamp'][:19]}  [{hit['mood']}]  {hit['snippet']}")
+    print(f"{len(hits)} hits in {elapsed_ms:.1f} ms ({len(archive)} exchanges indexed)")
+    archive.close()
+    return 0 if hits else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
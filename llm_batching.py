@@ -0,0 +1,335 @@
+"""
+Continuous batching for Local AI Companion
+One llama.cpp context serves several generations at once: every step
+packs the next token of each running sequence (plus chunks of newly
+admitted prompts) into a single llama_decode call, admits new requests as
+soon as a slot frees up and evicts finished sequences from the KV cache
+"""
+
+import codecs
+import collections
+import json
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+MODEL_CONFIG_PATH = "model_config.json"
+DEFAULT_STOP = ("\nUser:",)
+
+
+def _seq_rm(llama_cpp, ctx, seq_id):
+    """Drop a sequence's KV cells (the function moved between llama.cpp releases)"""
+    if hasattr(llama_cpp, "llama_memory_seq_rm"):
+        llama_cpp.llama_memory_seq_rm(llama_cpp.llama_get_memory(ctx), seq_id, -1, -1)
+    elif hasattr(llama_cpp, "llama_kv_self_seq_rm"):
+        llama_cpp.llama_kv_self_seq_rm(ctx, seq_id, -1, -1)
+    else:
+        llama_cpp.llama_kv_cache_seq_rm(ctx, seq_id, -1, -1)
+
+
+def sample_token(logits, temperature, top_k=40, top_p=0.95, rng=np.random):
+    """Pick the next token from raw logits: greedy at temperature 0, else top-k/top-p"""
+    if temperature <= 0:
+        return int(np.argmax(logits))
+    k = min(top_k, logits.size)
+    candidates = np.argpartition(logits, -k)[-k:]
+    scores = logits[candidates].astype(np.float64) / temperature
+    order = np.argsort(scores)[::-1]
+    candidates, scores = candidates[order], scores[order]
+    probs = np.exp(scores - scores[0])
+    probs /= probs.sum()
+    if top_p < 1.0:
+        # Rounding can leave the cumulative sum just short of top_p, so clamp the cut
+        keep = min(int(np.searchsorted(np.cumsum(probs), top_p)) + 1, len(probs))
+        probs = probs[:keep] / probs[:keep].sum()
+    else:
+        keep = len(probs)
+    return int(candidates[rng.choice(keep, p=probs)])
+
+
+class _Sequence:
+    """One in-flight generation and its slot in the shared KV cache"""
+
+    def __init__(self, prompt, max_tokens, temperature, stop, cancelled, turn=None):
+        self.prompt = prompt
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.stop = stop
+        self.cancelled = cancelled or threading.Event()
+        self.turn = turn      # perf_metrics.Turn, told the prompt size and prefill time
+        self.prompt_tokens = 0
+        self.admitted = None
+        self.output = queue.Queue()
+        self.future = Future()
+        self.seq_id = None
+        self.pending = []     # tokens still to be decoded (prompt, then the last sampled token)
+        self.pos = 0
+        self.generated = 0
+        self.text = []
+        self.held = ""        # text that may be the start of a stop string
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    def emit(self, piece):
+        """Pass text through, holding back anything that could begin a stop string; True when a stop hit"""
+        self.held += piece
+        for stop in self.stop:
+            index = self.held.find(stop)
+            if index >= 0:
+                self._send(self.held[:index])
+                self.held = ""
+                return True
+        hold = 0
+        for stop in self.stop:
+            for size in range(min(len(stop) - 1, len(self.held)), 0, -1):
+                if self.held.endswith(stop[:size]):
+                    hold = max(hold, size)
+                    break
+        self._send(self.held[:len(self.held) - hold])
+        self.held = self.held[len(self.held) - hold:]
+        return False
+
+    def _send(self, text):
+        if text:
+            self.text.append(text)
+            self.output.put(text)
+
+
+class BatchedLlama:
+    """A llama.cpp model shared by up to ``n_parallel`` concurrent generations
+
+    ``stream()`` and ``generate()`` may be called from any thread; all
+    llama.cpp calls happen on one scheduler thread. Each step decodes one
+    token for every running sequence in a single batch, and fills the rest
+    of the ``n_batch`` budget with prompt chunks of newly admitted
+    requests, so long prompts never stall the streams already running.
+    Each sequence gets ``n_ctx`` positions of its own.
+    """
+
+    name = "llama"
+
+    def __init__(self, model_path, n_ctx=2048, n_threads=None, n_parallel=4, n_batch=512,
+                 n_gpu_layers=0, top_k=40, top_p=0.95, stop=DEFAULT_STOP):
+        import llama_cpp
+        from llama_cpp import Llama
+
+        self.logger = logging.getLogger(__name__)
+        self.llama_cpp = llama_cpp
+        self.n_ctx = n_ctx
+        self.parallel = n_parallel  # the server sizes its generation workers from this
+        self.n_batch = n_batch
+        self.top_k = top_k
+        self.top_p = top_p
+        self.stop = tuple(stop)
+
+        # The Llama wrapper loads (mmaps) the weights and tokenizes; its own
+        # context is kept tiny since decoding uses the shared one below
+        self.model = Llama(model_path=model_path, n_ctx=64, n_batch=64, n_gpu_layers=n_gpu_layers,
+                           n_threads=n_threads, verbose=False)
+        self.n_vocab = self.model.n_vocab()
+        self.eos = self.model.token_eos()
+
+        params = llama_cpp.llama_context_default_params()
+        params.n_ctx = n_ctx * n_parallel
+        params.n_batch = n_batch
+        params.n_ubatch = n_batch
+        params.n_seq_max = n_parallel
+        if n_threads:
+            params.n_threads = n_threads
+            params.n_threads_batch = n_threads
+        new_context = getattr(llama_cpp, "llama_init_from_model", None) or llama_cpp.llama_new_context_with_model
+        self.ctx = new_context(self.model.model, params)
+        if not self.ctx:
+            raise RuntimeError("failed to create llama.cpp context")
+        self.batch = llama_cpp.llama_batch_init(n_batch, 0, n_parallel)
+
+        self._waiting = collections.deque()
+        self._active = []
+        self._free_slots = list(range(n_parallel - 1, -1, -1))
+        self._condition = threading.Condition()
+        self._stopped = False
+        self.steps = 0
+        self.batched_tokens = 0
+        self.generated_tokens = 0
+        self._thread = threading.Thread(target=self._run, name="llama-batcher", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_config(cls, path=MODEL_CONFIG_PATH, **overrides):
+        with open(path, "r", encoding="utf-8") as f:
+            cfg = json.load(f)
+        if "model_path" not in cfg:
+            raise ValueError("Model path not found in model_config.json")
+        options = {
+            "n_ctx": cfg.get("n_ctx", 2048),
+            "n_threads": cfg.get("n_threads"),
+            "n_parallel": cfg.get("n_parallel", 4),
+            "n_batch": cfg.get("n_batch", 512),
+            "n_gpu_layers": cfg.get("n_gpu_layers", 0),
+        }
+        options.update(overrides)
+        return cls(cfg["model_path"], **options)
+
+    def submit(self, prompt, max_tokens=300, temperature=0.8, stop=None, cancelled=None, turn=None):
+        """Queue a generation; tokens arrive on ``seq.output`` and ``seq.future`` gets the full text"""
+        seq = _Sequence(prompt, max_tokens, temperature, self.stop if stop is None else tuple(stop),
+                        cancelled, turn)
+        with self._condition:
+            if self._stopped:
+                raise RuntimeError("model is closed")
+            self._waiting.append(seq)
+            self._condition.notify()
+        return seq
+
+    def stream(self, prompt, max_tokens=300, temperature=0.8, cancelled=None, stop=None, turn=None):
+        """Yield text pieces as they are generated"""
+        seq = self.submit(prompt, max_tokens, temperature, stop, cancelled, turn)
+        try:
+            while True:
+                piece = seq.output.get()
+                if piece is None:
+                    break
+                if isinstance(piece, Exception):
+                    raise piece
+                yield piece
+        finally:
+            seq.cancelled.set()  # the consumer stopped early; free the slot
+
+    def generate(self, prompt, max_tokens=300, temperature=0.8, stop=None):
+        return self.submit(prompt, max_tokens, temperature, stop).future.result()
+
+    def prompt(self, prompt_text, system_prompt=None, max_tokens=300):
+        """Same call as GGUFModelRunner.prompt, so the batcher can stand in for it"""
+        text = f"{system_prompt}\n" if system_prompt else ""
+        return self.generate(f"{text}User: {prompt_text}\nAssistant:", max_tokens).strip()
+
+    def stats(self):
+        with self._condition:
+            return {
+                "active": len(self._active),
+                "waiting": len(self._waiting),
+                "steps": self.steps,
+                "generated_tokens": self.generated_tokens,
+                "mean_batch": round(self.batched_tokens / self.steps, 2) if self.steps else 0.0,
+            }
+
+    def close(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        self._thread.join(10.0)
+        self.llama_cpp.llama_batch_free(self.batch)
+        self.llama_cpp.llama_free(self.ctx)
+
+    def _admit(self, seq):
+        tokens = self.model.tokenize(seq.prompt.encode("utf-8"), add_bos=True, special=True)
+        seq.max_tokens = max(1, min(seq.max_tokens, self.n_ctx // 2))
+        room = self.n_ctx - seq.max_tokens
+        if len(tokens) > room:
+            tokens = tokens[:1] + tokens[-(room - 1):]  # keep BOS and the most recent text
+        seq.seq_id = self._free_slots.pop()
+        seq.pending = list(tokens)
+        seq.prompt_tokens = len(tokens)
+        seq.admitted = time.perf_counter()
+        self._active.append(seq)
+
+    def _finish(self, seq, error=None):
+        _seq_rm(self.llama_cpp, self.ctx, seq.seq_id)
+        self._free_slots.append(seq.seq_id)
+        self._active.remove(seq)
+        if error is not None:
+            seq.output.put(error)
+            seq.future.set_exception(error)
+            return
+        if not seq.cancelled.is_set():
+            seq._send(seq.held + seq.decoder.decode(b"", final=True))
+        seq.output.put(None)
+        seq.future.set_result("".join(seq.text))
+
+    def _fill_batch(self):
+        """Pack decode tokens first, then prompt chunks; returns the sequences that need sampling"""
+        batch = self.batch
+        n = 0
+        sampled = []
+        # Generating sequences (one pending token) go first so they never wait behind a prefill
+        for seq in sorted(self._active, key=lambda s: len(s.pending)):
+            take = min(len(seq.pending), self.n_batch - n)
+            if take <= 0:
+                break
+            for token in seq.pending[:take]:
+                batch.token[n] = token
+                batch.pos[n] = seq.pos
+                batch.n_seq_id[n] = 1
+                batch.seq_id[n][0] = seq.seq_id
+                batch.logits[n] = 0
+                seq.pos += 1
+                n += 1
+            del seq.pending[:take]
+            if not seq.pending:
+                batch.logits[n - 1] = 1
+                sampled.append((seq, n - 1))
+        batch.n_tokens = n
+        return n, sampled
+
+    def _step(self):
+        for seq in [s for s in self._active if s.cancelled.is_set()]:
+            self._finish(seq)
+        if not self._active:
+            return
+        n, sampled = self._fill_batch()
+        status = self.llama_cpp.llama_decode(self.ctx, self.batch)
+        self.steps += 1
+        self.batched_tokens += n
+        if status != 0:
+            error = RuntimeError(f"llama_decode failed ({status})")
+            for seq in list(self._active):
+                self._finish(seq, error)
+            return
+
+        for seq, index in sampled:
+            logits = np.ctypeslib.as_array(self.llama_cpp.llama_get_logits_ith(self.ctx, index),
+                                           shape=(self.n_vocab,))
+            token = sample_token(logits, seq.temperature, self.top_k, self.top_p)
+            if seq.generated == 0 and seq.turn is not None:
+                seq.turn.prompt_evaluated(seq.prompt_tokens, (time.perf_counter() - seq.admitted) * 1000)
+            if token == self.eos:
+                self._finish(seq)
+                continue
+            seq.generated += 1
+            self.generated_tokens += 1
+            piece = seq.decoder.decode(self.model.detokenize([token], special=False))
+            if seq.emit(piece) or seq.generated >= seq.max_tokens:
+                self._finish(seq)
+            else:
+                seq.pending = [token]
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._active and not self._waiting and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    abandoned = list(self._waiting) + list(self._active)
+                    self._waiting.clear()
+                    break
+                admitted = []
+                while self._waiting and len(admitted) < len(self._free_slots):
+                    admitted.append(self._waiting.popleft())
+            for seq in admitted:
+                try:
+                    self._admit(seq)
+                except Exception as e:
+                    seq.output.put(e)
+                    seq.future.set_exception(e)
+            try:
+                self._step()
+            except Exception as e:
+                self.logger.error(f"Batch step failed: {e}")
+                for seq in list(self._active):
+                    self._finish(seq, e)
+        for seq in abandoned:
+            seq.output.put(None)
+            seq.future.cancel()
@@ -2,43 +2,188 @@
 Logging utilities for Local AI Companion
 """
 
+import atexit
+import gzip
+import json
 import logging
 import os
+import queue
+import shutil
+import threading
+import time
 from datetime import datetime
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
-def setup_logger(name, log_file, level=logging.INFO):
-    """Setup logger with file and console handlers"""
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    )
-    
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+_STOP = object()
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_setup_lock = threading.Lock()
+_log_queue = None
+_log_listener = None
+_log_router = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, for log files that are parsed later"""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "logger": record.name,
+            "level": record.levelname,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class _LogRouter(logging.Handler):
+    """Runs on the listener thread: writes each record to its logger's file and the console"""
+
+    def __init__(self):
+        super().__init__()
+        self.files = {}
+        self.console = logging.StreamHandler()
+        self.console.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    def add_file(self, log_file, json_format):
+        if log_file not in self.files:
+            self.files[log_file] = _file_handler(log_file, json_format)
+
+    def emit(self, record):
+        handler = self.files.get(getattr(record, "log_file", None))
+        if handler is not None:
+            handler.handle(record)
+        self.console.handle(record)
+
+    def close(self):
+        for handler in self.files.values():
+            handler.close()
+        super().close()
+
+
+class _FileQueueHandler(QueueHandler):
+    """Enqueues records tagged with the file they belong in"""
+
+    def __init__(self, log_queue, log_file):
+        super().__init__(log_queue)
+        self.log_file = log_file
+
+    def prepare(self, record):
+        record = super().prepare(record)
+        record.log_file = self.log_file
+        return record
+
+
+def _file_handler(log_file, json_format):
+    directory = os.path.dirname(log_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
     # File handler with rotation
     file_handler = RotatingFileHandler(
         log_file, 
         maxBytes=10*1024*1024,  # 10MB
-        backupCount=5
+        backupCount=5,
+        encoding='utf-8'
     )
-    file_handler.setFormatter(formatter)
-    
-    # Console handler
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(formatter)
-    
+    file_handler.setFormatter(JsonFormatter() if json_format else logging.Formatter(LOG_FORMAT))
+    return file_handler
+
+
+def _start_listener():
+    """Start the single listener thread shared by every queued logger"""
+    global _log_queue, _log_listener, _log_router
+    if _log_listener is None:
+        _log_queue = queue.Queue(-1)
+        _log_router = _LogRouter()
+        _log_listener = QueueListener(_log_queue, _log_router)
+        _log_listener.start()
+        atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Drain queued records and stop the listener thread"""
+    global _log_listener
+    with _setup_lock:
+        if _log_listener is not None:
+            _log_listener.stop()
+            _log_router.close()
+            _log_listener = None
+
+
+def setup_logger(name, log_file, level=logging.INFO, use_queue=True, json_format=False):
+    """Setup logger with file and console handlers
+
+    With ``use_queue`` (the default) the logger only gets a QueueHandler and
+    one shared listener thread does the file and console I/O, so logging
+    calls never wait on the disk. ``json_format`` writes the file as JSON
+    lines. Calling it again for the same name returns the logger unchanged
+    apart from its level.
+    """
     logger = logging.getLogger(name)
     logger.setLevel(level)
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+
+    with _setup_lock:
+        if any(getattr(h, "companion_handler", False) for h in logger.handlers):
+            return logger
+
+        if use_queue:
+            _start_listener()
+            _log_router.add_file(log_file, json_format)
+            handlers = [_FileQueueHandler(_log_queue, log_file)]
+        else:
+            console_handler = logging.StreamHandler()
+            console_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+            handlers = [_file_handler(log_file, json_format), console_handler]
+
+        for handler in handlers:
+            handler.companion_handler = True
+            logger.addHandler(handler)
     
     return logger
 
 class ConversationLogger:
-    """Specialized logger for conversation tracking"""
-    
-    def __init__(self, log_dir):
+    """Specialized logger for conversation tracking
+
+    Entries go onto a bounded queue and a background thread writes them to
+    ``conversations.jsonl`` through one open handle, flushing every
+    ``flush_every`` entries or ``flush_interval`` seconds. The file rotates
+    when it passes ``max_bytes`` or the date changes; rotated segments are
+    named ``conversations-<timestamp>.jsonl`` (sortable by age) and
+    optionally compressed ("gzip", or "zstd" when the zstandard package is
+    installed). If the queue is full the entry is dropped, so logging never
+    blocks a turn.
+    """
+
+    def __init__(self, log_dir, max_queue=1000, flush_every=20, flush_interval=1.0,
+                 max_bytes=10*1024*1024, rotate_daily=True, compression="gzip"):
         self.log_dir = log_dir
         self.conversation_log = os.path.join(log_dir, "conversations.jsonl")
-        
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.rotate_daily = rotate_daily
+        self.compression = compression
+        self.logger = logging.getLogger(__name__)
+        self.written = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._file = None
+        self._file_date = None
+        self._closed = False
+        os.makedirs(log_dir, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="conversation-log", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
     def log_conversation(self, user_message, assistant_response, mood, model_info):
         """Log a conversation exchange"""
         log_entry = {
@@ -50,13 +195,129 @@ class ConversationLogger:
             "session_id": self.get_session_id()
         }
         
+        if self._closed:
+            return False
         try:
-            with open(self.conversation_log, 'a', encoding='utf-8') as f:
-                f.write(json.dumps(log_entry, ensure_ascii=False) + '\n')
-        except Exception as e:
-            logging.error(f"Failed to log conversation: {e}")
+            self._queue.put_nowait(log_entry)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 100 == 0:
+                self.logger.warning(f"Conversation log queue full, dropped {self.dropped} entries so far")
+            return False
     
     def get_session_id(self):
         """Get or create session ID"""
         # Simple session ID based on date
         return datetime.now().strftime('%Y%m%d')
+
+    def flush(self, timeout=5.0):
+        """Block until everything queued so far is on disk"""
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def close(self, timeout=5.0):
+        """Write out pending entries and stop the writer thread"""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            self.logger.error("Conversation log queue stuck, pending entries lost")
+            return
+        self._thread.join(timeout)
+
+    def _run(self):
+        pending = 0
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if isinstance(item, dict):
+                try:
+                    self._write(item)
+                    pending += 1
+                except Exception as e:
+                    self.logger.error(f"Failed to log conversation: {e}")
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                if pending < self.flush_every and time.monotonic() < deadline:
+                    continue
+
+            # Group commit: one flush for everything written since the last one
+            if self._file is not None and pending:
+                try:
+                    self._file.flush()
+                except Exception as e:
+                    self.logger.error(f"Failed to flush conversation log: {e}")
+            pending = 0
+            deadline = None
+
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is _STOP:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                return
+
+    def _write(self, entry):
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        today = datetime.now().date()
+        if self._file is None:
+            self._open()
+        if self._file.tell() and (
+            self._file.tell() + len(line) > self.max_bytes
+            or (self.rotate_daily and today != self._file_date)
+        ):
+            self._rotate()
+        self._file.write(line)
+        self.written += 1
+
+    def _open(self):
+        self._file = open(self.conversation_log, 'a', encoding='utf-8')
+        if self._file.tell():
+            self._file_date = datetime.fromtimestamp(os.path.getmtime(self.conversation_log)).date()
+        else:
+            self._file_date = datetime.now().date()
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        segment = os.path.join(self.log_dir, f"conversations-{stamp}.jsonl")
+        suffix = 1
+        while any(os.path.exists(segment + ext) for ext in ("", ".gz", ".zst")):
+            segment = os.path.join(self.log_dir, f"conversations-{stamp}-{suffix}.jsonl")
+            suffix += 1
+        os.replace(self.conversation_log, segment)
+        self._open()
+        if self.compression:
+            try:
+                compress_segment(segment, self.compression)
+            except Exception as e:
+                self.logger.error(f"Failed to compress {segment}: {e}")
+
+
+def compress_segment(path, compression="gzip"):
+    """Compress a rotated log segment next to itself and remove the original"""
+    if compression == "zstd" and zstandard is not None:
+        target = path + ".zst"
+        with open(path, 'rb') as src, open(target + ".tmp", 'wb') as dst:
+            zstandard.ZstdCompressor(level=10).copy_stream(src, dst)
+    else:
+        target = path + ".gz"
+        with open(path, 'rb') as src, gzip.open(target + ".tmp", 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+    os.replace(target + ".tmp", target)
+    os.remove(path)
+    return target
@@ -3,27 +3,191 @@ Memory management utilities for Local AI Companion
 Handles long-term memory, user preferences, and conversation patterns
 """
 
+import atexit
+import bisect
+import collections
+import heapq
+import itertools
 import json
 import os
+import tempfile
+import threading
+import time
 from datetime import datetime
 import logging
 
+from memory_sqlite import SQLiteMemoryStore, check_personal_detail
+
+# Upper bounds (ms) of the flush latency histogram buckets; the last bucket is open-ended
+FLUSH_BUCKETS_MS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000]
+
+# Bounded histories are kept as ring buffers
+MAX_EMOTIONAL_STATES = 100
+MAX_CONVERSATION_TIMES = 50
+
+# Number of most frequent topics kept up to date incrementally
+TOP_TOPICS_TRACKED = 10
+
 class MemoryManager:
-    def __init__(self, memory_file):
+    def __init__(self, memory_file, write_behind=False, flush_delay=2.0, flush_every=20,
+                 journal=False, compact_every=500, backend="json"):
+        """
+        With write_behind enabled, mutators only mark memory dirty; it is
+        written after flush_delay seconds without further changes, after
+        flush_every pending mutations, or on close()/interpreter exit.
+
+        With journal enabled, each mutation is appended to
+        <memory_file>.journal instead, and the memory file becomes a
+        snapshot rewritten every compact_every mutations and on close().
+
+        With backend="sqlite", memory lives in indexed SQLite tables (WAL
+        mode) next to memory_file; an existing JSON memory file is imported
+        on first use. The write_behind and journal options do not apply.
+        """
+        if backend not in ("json", "sqlite"):
+            raise ValueError(f"Unknown memory backend: {backend}")
         self.memory_file = memory_file
+        self.journal_file = memory_file + ".journal"
         self.logger = logging.getLogger(__name__)
+        self.store = None
+        if backend == "sqlite":
+            self.store = SQLiteMemoryStore(
+                os.path.splitext(memory_file)[0] + ".db",
+                max_emotional_states=MAX_EMOTIONAL_STATES,
+                max_conversation_times=MAX_CONVERSATION_TIMES
+            )
+            journal = write_behind = False
+        self.journal = journal
+        self.compact_every = compact_every
+        self.write_behind = write_behind
+        self.flush_delay = flush_delay
+        self.flush_every = flush_every
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()
+        self._pending_mutations = 0
+        # One flusher thread per write-behind manager, woken when the debounce deadline moves
+        self._flush_deadline = None
+        self._flush_wakeup = threading.Condition(self._lock)
+        self._flush_thread = None
+        self._flusher_stop = False
+        self._flush_histogram = [0] * (len(FLUSH_BUCKETS_MS) + 1)
+        self._flush_count = 0
+        self._flush_total_ms = 0.0
+        self._flush_max_ms = 0.0
+        self._journal_seq = 0
+        self._journal_handle = None
+        # In-memory indexes over the JSON document, rebuilt lazily after a load
+        self._topic_index = None
+        self._frequent_top = None
+        self._appliers = {
+            "emotion": self._apply_emotional_state,
+            "topic": self._apply_important_topic,
+            "pattern": self._apply_conversation_pattern,
+            "detail": self._apply_personal_detail,
+        }
         self.memory = self.load_memory()
+        if self.journal:
+            self._journal_handle = open(self.journal_file, 'a', encoding='utf-8')
+        if self.write_behind or self.journal or self.store is not None:
+            atexit.register(self.close)
+
+    @property
+    def memory(self):
+        """The memory document; a read-only export when the SQLite backend is used"""
+        if self.store is not None:
+            return self._bound_histories(self.store.export_memory())
+        return self._memory
+
+    @memory.setter
+    def memory(self, value):
+        self._memory = value
     
     def load_memory(self):
-        """Load memory from file"""
+        """Load memory from file, then replay any journal entries newer than it"""
+        if self.store is not None:
+            return self._load_sqlite()
+
+        self._topic_index = None
+        self._frequent_top = None
+        memory = None
         if os.path.exists(self.memory_file):
             try:
                 with open(self.memory_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                    memory = json.load(f)
             except Exception as e:
                 self.logger.error(f"Error loading memory: {e}")
         
-        return self.create_empty_memory()
+        if memory is None:
+            memory = self.create_empty_memory()
+        self._memory = self._bound_histories(memory)
+        self._journal_seq = self._memory.get("journal_seq", 0)
+        if self.journal:
+            self._replay_journal()
+        return self._memory
+
+    def _load_sqlite(self):
+        """Import the JSON memory file into a new database, if there is one"""
+        if self.store.is_empty():
+            memory = None
+            if os.path.exists(self.memory_file):
+                try:
+                    with open(self.memory_file, 'r', encoding='utf-8') as f:
+                        memory = json.load(f)
+                    self.logger.info(f"Importing {self.memory_file} into {self.store.db_file}")
+                except Exception as e:
+                    self.logger.error(f"Error loading memory for import: {e}")
+            self.store.import_memory(memory or self.create_empty_memory())
+        return None
+
+    def _bound_histories(self, memory):
+        """Back the trimmed histories with fixed-size ring buffers"""
+        memory["emotional_state_history"] = collections.deque(
+            memory.get("emotional_state_history", []), maxlen=MAX_EMOTIONAL_STATES
+        )
+        patterns = memory["conversation_patterns"]
+        patterns["conversation_times"] = collections.deque(
+            patterns.get("conversation_times", []), maxlen=MAX_CONVERSATION_TIMES
+        )
+        return memory
+
+    def _replay_journal(self):
+        if not os.path.exists(self.journal_file):
+            return
+        replayed = 0
+        kept_lines = []
+        torn = False
+        with open(self.journal_file, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn final line from a crash mid-append is expected; skip it
+                    self.logger.warning(f"Skipping unreadable journal line {line_number}")
+                    torn = True
+                    continue
+                if record.get("seq", 0) <= self._journal_seq:
+                    continue
+                kept_lines.append(line if line.endswith('\n') else line + '\n')
+                applier = self._appliers.get(record.get("op"))
+                if applier is None:
+                    self.logger.warning(f"Unknown journal op '{record.get('op')}' on line {line_number}")
+                    continue
+                try:
+                    applier(record)
+                except ValueError as e:
+                    self.logger.warning(f"Skipping invalid journal record on line {line_number}: {e}")
+                    continue
+                self._journal_seq = record["seq"]
+                replayed += 1
+        if torn:
+            # Rewrite without the damaged lines so new appends start on a clean line
+            temp_path = self.journal_file + ".tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.writelines(kept_lines)
+            os.replace(temp_path, self.journal_file)
+        self._pending_mutations = replayed
+        if replayed:
+            self.logger.info(f"Recovered {replayed} memory changes from journal")
     
     def create_empty_memory(self):
         """Create empty memory structure"""
@@ -52,85 +216,366 @@ class MemoryManager:
             "last_updated": datetime.now().isoformat()
         }
     
-    def save_memory(self):
-        """Save memory to file"""
+    def save_memory(self, durable=None):
+        """Save memory to file atomically (temp file + rename)
+
+        ``durable`` fsyncs the file before the rename; by default only
+        write-behind flushes and journal compactions do, since those stand
+        in for many mutations (a plain per-mutation save stays cheap).
+        """
+        if durable is None:
+            durable = self.write_behind or self.journal
+        if self.store is not None:
+            return  # every SQLite mutation is already committed
+        started = time.perf_counter()
         try:
-            self.memory["last_updated"] = datetime.now().isoformat()
-            with open(self.memory_file, 'w', encoding='utf-8') as f:
-                json.dump(self.memory, f, indent=2, ensure_ascii=False)
+            with self._write_lock:
+                with self._lock:
+                    self.memory["last_updated"] = datetime.now().isoformat()
+                    if self.journal:
+                        self.memory["journal_seq"] = self._journal_seq
+                    snapshot_seq = self._journal_seq
+                    data = json.dumps(self.memory, indent=2, ensure_ascii=False, default=list)
+                    self._pending_mutations = 0
+                self._write_atomic(data, durable)
+                if self.journal:
+                    self._truncate_journal(snapshot_seq)
+            self._record_flush((time.perf_counter() - started) * 1000)
             self.logger.info("Memory saved successfully")
         except Exception as e:
             self.logger.error(f"Error saving memory: {e}")
+
+    def _write_atomic(self, data, durable=True):
+        directory = os.path.dirname(os.path.abspath(self.memory_file))
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(prefix=".memory-", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(data)
+                if durable:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(temp_path, self.memory_file)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def _truncate_journal(self, snapshot_seq):
+        """Drop journal entries already contained in the snapshot"""
+        with self._lock:
+            if self._journal_handle is None:
+                return
+            self._journal_handle.close()
+            newer = []
+            with open(self.journal_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        if json.loads(line).get("seq", 0) > snapshot_seq:
+                            newer.append(line)
+                    except ValueError:
+                        continue
+            temp_path = self.journal_file + ".tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.writelines(newer)
+            os.replace(temp_path, self.journal_file)
+            self._journal_handle = open(self.journal_file, 'a', encoding='utf-8')
+
+    def _commit(self, record):
+        """Apply a mutation record and persist it according to the storage mode"""
+        if self.store is not None:
+            started = time.perf_counter()
+            try:
+                self._apply_to_store(record)
+                self._record_flush((time.perf_counter() - started) * 1000)
+            except ValueError:
+                raise
+            except Exception as e:
+                self.logger.error(f"Error saving memory: {e}")
+            return
+
+        with self._lock:
+            # Appliers raise before changing anything, so a rejected record is never journaled
+            record["seq"] = self._journal_seq + 1
+            self._appliers[record["op"]](record)
+            self._journal_seq = record["seq"]
+            if self._journal_handle is not None:
+                self._journal_handle.write(json.dumps(record, ensure_ascii=False) + '\n')
+                self._journal_handle.flush()
+        self._mark_dirty()
+
+    def _apply_to_store(self, record):
+        op = record["op"]
+        if op == "emotion":
+            self.store.add_emotional_state(record["timestamp"], record["mood"], record["context"])
+        elif op == "topic":
+            self.store.add_important_topic(record["timestamp"], record["topic"], record["importance_level"])
+        elif op == "pattern":
+            self.store.update_conversation_pattern(record["timestamp"], record["topic"], record["mood"])
+        elif op == "detail":
+            self.store.add_personal_detail(record["timestamp"], record["category"], record["detail"], record["value"])
+
+    def _mark_dirty(self):
+        """Persist now, or schedule a debounced flush in write-behind mode"""
+        if self.journal:
+            with self._lock:
+                self._pending_mutations += 1
+                compact_now = self._pending_mutations >= self.compact_every
+            if compact_now:
+                self.save_memory()
+            return
+
+        if not self.write_behind:
+            self.save_memory()
+            return
+
+        with self._lock:
+            self._pending_mutations += 1
+            flush_now = self._pending_mutations >= self.flush_every
+            if flush_now:
+                self._flush_deadline = None
+            else:
+                self._flush_deadline = time.monotonic() + self.flush_delay
+                if self._flush_thread is None:
+                    self._flusher_stop = False
+                    self._flush_thread = threading.Thread(target=self._flush_loop, name="memory-flusher",
+                                                          daemon=True)
+                    self._flush_thread.start()
+                self._flush_wakeup.notify()
+        if flush_now:
+            self.save_memory()
+
+    def _flush_loop(self):
+        """Flush once the deadline passes without further mutations pushing it back"""
+        while True:
+            with self._lock:
+                while not self._flusher_stop:
+                    if self._flush_deadline is None:
+                        self._flush_wakeup.wait()
+                        continue
+                    remaining = self._flush_deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._flush_wakeup.wait(remaining)
+                if self._flusher_stop:
+                    return
+            self.flush()
+
+    def flush(self):
+        """Write pending changes, if any"""
+        with self._lock:
+            self._flush_deadline = None
+            dirty = self._pending_mutations > 0
+        if dirty:
+            self.save_memory()
+
+    def close(self):
+        """Flush pending changes; call on shutdown"""
+        # Drop the exit hook so a closed manager (and its memory) can be freed
+        atexit.unregister(self.close)
+        with self._lock:
+            self._flusher_stop = True
+            self._flush_thread = None
+            self._flush_wakeup.notify_all()
+        self.flush()
+        with self._lock:
+            if self._journal_handle is not None:
+                self._journal_handle.close()
+                self._journal_handle = None
+            if self.store is not None:
+                self.store.close()
+                self.store = None
+
+    def _record_flush(self, elapsed_ms):
+        with self._lock:
+            self._flush_histogram[bisect.bisect_left(FLUSH_BUCKETS_MS, elapsed_ms)] += 1
+            self._flush_count += 1
+            self._flush_total_ms += elapsed_ms
+            self._flush_max_ms = max(self._flush_max_ms, elapsed_ms)
+
+    def get_flush_stats(self):
+        """Flush latency histogram: bucket upper bound (ms, None = overflow) -> count"""
+        with self._lock:
+            buckets = FLUSH_BUCKETS_MS + [None]
+            return {
+                "flushes": self._flush_count,
+                "pending_mutations": self._pending_mutations,
+                "mean_ms": self._flush_total_ms / self._flush_count if self._flush_count else 0.0,
+                "max_ms": self._flush_max_ms,
+                "histogram": list(zip(buckets, self._flush_histogram)),
+            }
     
     def add_emotional_state(self, mood, context=""):
         """Add emotional state to history"""
-        emotional_entry = {
+        self._commit({
+            "op": "emotion",
             "timestamp": datetime.now().isoformat(),
             "mood": mood,
             "context": context
+        })
+
+    def _apply_emotional_state(self, record):
+        emotional_entry = {
+            "timestamp": record["timestamp"],
+            "mood": record["mood"],
+            "context": record["context"]
         }
         
+        # The deque keeps only the last MAX_EMOTIONAL_STATES entries
         self.memory["emotional_state_history"].append(emotional_entry)
-        
-        # Keep only last 100 emotional states
-        if len(self.memory["emotional_state_history"]) > 100:
-            self.memory["emotional_state_history"] = self.memory["emotional_state_history"][-100:]
-        
-        self.save_memory()
     
     def add_important_topic(self, topic, importance_level=1):
         """Add important topic to memory"""
+        self._commit({
+            "op": "topic",
+            "timestamp": datetime.now().isoformat(),
+            "topic": topic,
+            "importance_level": importance_level
+        })
+
+    def _apply_important_topic(self, record):
+        topic = record["topic"]
         topic_entry = {
             "topic": topic,
-            "timestamp": datetime.now().isoformat(),
-            "importance_level": importance_level,
+            "timestamp": record["timestamp"],
+            "importance_level": record["importance_level"],
             "mentions": 1
         }
         
         # Check if topic already exists
-        for existing_topic in self.memory["important_topics"]:
-            if existing_topic["topic"].lower() == topic.lower():
-                existing_topic["mentions"] += 1
-                existing_topic["last_mentioned"] = datetime.now().isoformat()
-                self.save_memory()
-                return
+        index = self._topics_by_key()
+        existing_topic = index.get(topic.casefold())
+        if existing_topic is not None:
+            existing_topic["mentions"] += 1
+            existing_topic["last_mentioned"] = record["timestamp"]
+            return
         
         self.memory["important_topics"].append(topic_entry)
-        self.save_memory()
+        index[topic.casefold()] = topic_entry
+
+    def _topics_by_key(self):
+        """Case-folded topic name -> entry in important_topics"""
+        if self._topic_index is None:
+            self._topic_index = {}
+            for entry in self.memory["important_topics"]:
+                self._topic_index.setdefault(entry["topic"].casefold(), entry)
+        return self._topic_index
     
     def update_conversation_pattern(self, topic, mood):
         """Update conversation patterns"""
+        self._commit({
+            "op": "pattern",
+            "timestamp": datetime.now().isoformat(),
+            "topic": topic,
+            "mood": mood
+        })
+
+    def _apply_conversation_pattern(self, record):
         patterns = self.memory["conversation_patterns"]
+        topic = record["topic"]
         
         # Update frequent topics
         if topic in patterns["frequent_topics"]:
             patterns["frequent_topics"][topic] += 1
         else:
             patterns["frequent_topics"][topic] = 1
+        self._bump_frequent_top(topic, patterns["frequent_topics"][topic])
         
         # Update typical mood
-        patterns["typical_mood"] = mood
+        patterns["typical_mood"] = record["mood"]
         
-        # Add conversation time
-        patterns["conversation_times"].append(datetime.now().isoformat())
-        
-        # Keep only last 50 conversation times
-        if len(patterns["conversation_times"]) > 50:
-            patterns["conversation_times"] = patterns["conversation_times"][-50:]
-        
-        self.save_memory()
+        # Add conversation time (the deque keeps only the last MAX_CONVERSATION_TIMES)
+        patterns["conversation_times"].append(record["timestamp"])
+    
+    def _top_frequent(self):
+        """The TOP_TOPICS_TRACKED most frequent (topic, count) pairs, highest first"""
+        if self._frequent_top is None:
+            self._frequent_top = heapq.nlargest(
+                TOP_TOPICS_TRACKED,
+                self.memory["conversation_patterns"]["frequent_topics"].items(),
+                key=lambda x: x[1]
+            )
+        return self._frequent_top
+
+    def _bump_frequent_top(self, topic, count):
+        # Counts only ever grow by one, so a topic can only enter the top list
+        # by overtaking its current minimum
+        top = self._top_frequent()
+        for i, (existing, _) in enumerate(top):
+            if existing == topic:
+                top[i] = (topic, count)
+                break
+        else:
+            if len(top) < TOP_TOPICS_TRACKED:
+                top.append((topic, count))
+            elif count > top[-1][1]:
+                top[-1] = (topic, count)
+            else:
+                return
+        top.sort(key=lambda x: x[1], reverse=True)
+
+    def top_frequent_topics(self, k=5):
+        """Most frequent conversation topics as (topic, count), highest first"""
+        if self.store is not None:
+            return self.store.top_frequent_topics(k)
+        with self._lock:
+            if k <= TOP_TOPICS_TRACKED:
+                return list(self._top_frequent()[:k])
+            return heapq.nlargest(
+                k, self.memory["conversation_patterns"]["frequent_topics"].items(), key=lambda x: x[1]
+            )
+
+    def add_personal_detail(self, category, detail, value=None):
+        """Record a personal detail: an interest/goal/concern, or a keyed value such as a relationship
+
+        Raises ValueError if the value does not fit the category (a
+        relationship without a value, an interest with one).
+        """
+        self._commit({
+            "op": "detail",
+            "timestamp": datetime.now().isoformat(),
+            "category": category,
+            "detail": detail,
+            "value": value
+        })
+
+    def _apply_personal_detail(self, record):
+        details = self.memory["personal_details"]
+        existing = details.get(record["category"])
+        check_personal_detail(record["category"], record["detail"], record["value"],
+                              keyed=isinstance(existing, dict) if existing is not None else None)
+        if record["value"] is not None:
+            details.setdefault(record["category"], {})[record["detail"]] = record["value"]
+            return
+        entries = details.setdefault(record["category"], [])
+        if record["detail"].lower() not in (entry.lower() for entry in entries):
+            entries.append(record["detail"])
+
+    def get_topic(self, topic):
+        """Look up an important topic by name, ignoring case"""
+        if self.store is not None:
+            return self.store.find_topic(topic)
+        with self._lock:
+            existing_topic = self._topics_by_key().get(topic.casefold())
+            return dict(existing_topic) if existing_topic is not None else None
     
     def get_memory_summary(self):
         """Get a summary of memory contents"""
+        if self.store is not None:
+            return self.store.get_summary()
+        with self._lock:
+            return self._build_summary()
+
+    def _build_summary(self):
         return {
             "total_conversations": len(self.memory["conversation_patterns"]["conversation_times"]),
             "important_topics_count": len(self.memory["important_topics"]),
             "emotional_states_tracked": len(self.memory["emotional_state_history"]),
-            "most_frequent_topics": sorted(
-                self.memory["conversation_patterns"]["frequent_topics"].items(),
-                key=lambda x: x[1], reverse=True
-            )[:5],
+            "most_frequent_topics": list(self._top_frequent()[:5]),
             "recent_moods": [
-                state["mood"] for state in self.memory["emotional_state_history"][-10:]
+                state["mood"] for state in itertools.islice(
+                    self.memory["emotional_state_history"],
+                    max(0, len(self.memory["emotional_state_history"]) - 10), None
+                )
             ]
         }
@@ -0,0 +1,285 @@
+"""
+SQLite storage backend for MemoryManager
+Keeps topics, emotional states, conversation times and personal details in
+indexed tables so lookups and top-K queries do not scan the whole memory
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS important_topics (
+    id INTEGER PRIMARY KEY,
+    topic TEXT NOT NULL,
+    topic_key TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    importance_level INTEGER NOT NULL DEFAULT 1,
+    mentions INTEGER NOT NULL DEFAULT 1,
+    last_mentioned TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_important_topics_key ON important_topics (topic_key);
+CREATE TABLE IF NOT EXISTS frequent_topics (
+    topic TEXT PRIMARY KEY,
+    count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_frequent_topics_count ON frequent_topics (count DESC);
+CREATE TABLE IF NOT EXISTS emotional_states (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    mood TEXT NOT NULL,
+    context TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS conversation_times (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS personal_details (
+    category TEXT NOT NULL,
+    detail_key TEXT NOT NULL,
+    detail TEXT NOT NULL,
+    value TEXT,
+    PRIMARY KEY (category, detail_key)
+);
+"""
+
+# Sections of the memory document stored as JSON blobs in the meta table
+META_SECTIONS = ("user_preferences", "created", "last_updated", "typical_mood", "response_preferences")
+# Personal detail categories hold either a list of details or a detail -> value mapping
+LIST_DETAILS = ("interests", "goals", "concerns")
+KEYED_DETAILS = ("relationships",)
+
+
+def check_personal_detail(category, detail, value, keyed=None):
+    """Raise ValueError unless the detail fits its category's structure
+
+    Built-in categories have a fixed kind; for other categories ``keyed``
+    says whether existing entries hold values (None when there are none).
+    """
+    if not isinstance(category, str) or not category:
+        raise ValueError("category must be a non-empty string")
+    if not isinstance(detail, str) or not detail:
+        raise ValueError("detail must be a non-empty string")
+    if category in KEYED_DETAILS:
+        keyed = True
+    elif category in LIST_DETAILS:
+        keyed = False
+    if keyed and value is None:
+        raise ValueError(f"'{category}' details need a value")
+    if keyed is False and value is not None:
+        raise ValueError(f"'{category}' details take no value")
+
+
+
+class SQLiteMemoryStore:
+    """Memory tables in one SQLite database (WAL mode)"""
+
+    def __init__(self, db_file, max_emotional_states=100, max_conversation_times=50):
+        self.db_file = db_file
+        self.max_emotional_states = max_emotional_states
+        self.max_conversation_times = max_conversation_times
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def is_empty(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM meta").fetchone()[0] == 0
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    def _set_meta(self, key, value):
+        self.conn.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, json.dumps(value, ensure_ascii=False))
+        )
+
+    def _get_meta(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def add_emotional_state(self, timestamp, mood, context):
+        with self._lock, self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO emotional_states (timestamp, mood, context) VALUES (?, ?, ?)",
+                (timestamp, mood, context)
+            )
+            self.conn.execute(
+                "DELETE FROM emotional_states WHERE id <= ?",
+                (cursor.lastrowid - self.max_emotional_states,)
+            )
+            self._set_meta("last_updated", timestamp)
+
+    def add_important_topic(self, timestamp, topic, importance_level):
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO important_topics (topic, topic_key, timestamp, importance_level, mentions) "
+                "VALUES (?, ?, ?, ?, 1) "
+                "ON CONFLICT(topic_key) DO UPDATE SET mentions = mentions + 1, last_mentioned = excluded.timestamp",
+                (topic, topic.casefold(), timestamp, importance_level)
+            )
+            self._set_meta("last_updated", timestamp)
+
+    def update_conversation_pattern(self, timestamp, topic, mood):
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO frequent_topics (topic, count) VALUES (?, 1) "
+                "ON CONFLICT(topic) DO UPDATE SET count = count + 1",
+                (topic,)
+            )
+            self._set_meta("typical_mood", mood)
+            cursor = self.conn.execute(
+                "INSERT INTO conversation_times (timestamp) VALUES (?)", (timestamp,)
+            )
+            self.conn.execute(
+                "DELETE FROM conversation_times WHERE id <= ?",
+                (cursor.lastrowid - self.max_conversation_times,)
+            )
+            self._set_meta("last_updated", timestamp)
+
+    def add_personal_detail(self, timestamp, category, detail, value=None):
+        with self._lock, self.conn:
+            row = self.conn.execute(
+                "SELECT value IS NOT NULL FROM personal_details WHERE category = ? LIMIT 1", (category,)
+            ).fetchone()
+            check_personal_detail(category, detail, value, keyed=bool(row[0]) if row else None)
+            self.conn.execute(
+                "INSERT INTO personal_details (category, detail_key, detail, value) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(category, detail_key) DO UPDATE SET detail = excluded.detail, value = excluded.value",
+                (category, detail.casefold(), detail,
+                 json.dumps(value, ensure_ascii=False) if value is not None else None)
+            )
+            self._set_meta("last_updated", timestamp)
+
+    def find_topic(self, topic):
+        """Look up one important topic by its case-folded name"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT topic, timestamp, importance_level, mentions, last_mentioned "
+                "FROM important_topics WHERE topic_key = ?",
+                (topic.casefold(),)
+            ).fetchone()
+        return self._topic_row(row) if row else None
+
+    def top_frequent_topics(self, k=5):
+        with self._lock:
+            return [tuple(row) for row in self.conn.execute(
+                "SELECT topic, count FROM frequent_topics ORDER BY count DESC LIMIT ?", (k,)
+            )]
+
+    def get_summary(self, top_k=5, recent=10):
+        with self._lock:
+            count = lambda table: self.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            recent_moods = [row[0] for row in self.conn.execute(
+                "SELECT mood FROM emotional_states ORDER BY id DESC LIMIT ?", (recent,)
+            )]
+            summary = {
+                "total_conversations": count("conversation_times"),
+                "important_topics_count": count("important_topics"),
+                "emotional_states_tracked": count("emotional_states"),
+            }
+        summary["most_frequent_topics"] = self.top_frequent_topics(top_k)
+        summary["recent_moods"] = list(reversed(recent_moods))
+        return summary
+
+    @staticmethod
+    def _topic_row(row):
+        entry = {"topic": row[0], "timestamp": row[1], "importance_level": row[2], "mentions": row[3]}
+        if row[4]:
+            entry["last_mentioned"] = row[4]
+        return entry
+
+    def import_memory(self, memory):
+        """Load a MemoryManager JSON document into empty tables"""
+        patterns = memory.get("conversation_patterns", {})
+        with self._lock, self.conn:
+            for key in ("user_preferences", "created", "last_updated"):
+                if key in memory:
+                    self._set_meta(key, memory[key])
+            self._set_meta("typical_mood", patterns.get("typical_mood", ""))
+            self._set_meta("response_preferences", patterns.get("response_preferences", {}))
+            for entry in memory.get("important_topics", []):
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO important_topics "
+                    "(topic, topic_key, timestamp, importance_level, mentions, last_mentioned) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (entry["topic"], entry["topic"].casefold(), entry.get("timestamp", ""),
+                     entry.get("importance_level", 1), entry.get("mentions", 1), entry.get("last_mentioned"))
+                )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO frequent_topics (topic, count) VALUES (?, ?)",
+                list(patterns.get("frequent_topics", {}).items())
+            )
+            self.conn.executemany(
+                "INSERT INTO emotional_states (timestamp, mood, context) VALUES (?, ?, ?)",
+                [(e.get("timestamp", ""), e.get("mood", ""), e.get("context", ""))
+                 for e in list(memory.get("emotional_state_history", []))[-self.max_emotional_states:]]
+            )
+            self.conn.executemany(
+                "INSERT INTO conversation_times (timestamp) VALUES (?)",
+                [(t,) for t in list(patterns.get("conversation_times", []))[-self.max_conversation_times:]]
+            )
+            details = memory.get("personal_details", {})
+            for category, values in details.items():
+                if isinstance(values, dict):
+                    rows = [(category, k.casefold(), k, json.dumps(v, ensure_ascii=False)) for k, v in values.items()]
+                else:
+                    rows = [(category, str(v).casefold(), str(v), None) for v in values]
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO personal_details (category, detail_key, detail, value) "
+                    "VALUES (?, ?, ?, ?)", rows
+                )
+
+    def export_memory(self):
+        """Rebuild the MemoryManager JSON document from the tables"""
+        with self._lock:
+            topics = [self._topic_row(row) for row in self.conn.execute(
+                "SELECT topic, timestamp, importance_level, mentions, last_mentioned "
+                "FROM important_topics ORDER BY id"
+            )]
+            frequent = dict(self.conn.execute("SELECT topic, count FROM frequent_topics"))
+            emotions = [
+                {"timestamp": row[0], "mood": row[1], "context": row[2]}
+                for row in self.conn.execute("SELECT timestamp, mood, context FROM emotional_states ORDER BY id")
+            ]
+            times = [row[0] for row in self.conn.execute("SELECT timestamp FROM conversation_times ORDER BY id")]
+            details = {"interests": [], "goals": [], "concerns": [], "relationships": {}}
+            for category, detail, value in self.conn.execute(
+                "SELECT category, detail, value FROM personal_details ORDER BY rowid"
+            ):
+                entries = details.setdefault(category, {} if value is not None else [])
+                if isinstance(entries, dict) and value is not None:
+                    entries[detail] = json.loads(value)
+                elif isinstance(entries, list) and value is None:
+                    entries.append(detail)
+                else:
+                    # Written before details were checked against their category
+                    self.logger.warning(f"Skipping personal detail '{detail}' that does not fit '{category}'")
+            meta = {key: self._get_meta(key) for key in META_SECTIONS}
+
+        return {
+            "user_preferences": meta["user_preferences"] or {},
+            "conversation_patterns": {
+                "frequent_topics": frequent,
+                "typical_mood": meta["typical_mood"] or "",
+                "conversation_times": times,
+                "response_preferences": meta["response_preferences"] or {}
+            },
+            "important_topics": topics,
+            "emotional_state_history": emotions,
+            "personal_details": details,
+            "created": meta["created"],
+            "last_updated": meta["last_updated"]
+        }
@@ -0,0 +1,312 @@
+"""
+Long-term vector memory for Local AI Companion
+Embeds past turns and memory entries on the CPU and retrieves the most
+relevant ones for each prompt with NumPy cosine search (flat or IVF)
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+STOPWORDS = frozenset(
+    "a an and are as at be but by do does for from has have how i i'm in is it it's me my of on or "
+    "so that the this to was we what when with you your".split()
+)
+
+
+class HashingEmbedder:
+    """Dependency-free embedder: hashed word and word-pair features, L2-normalised"""
+
+    name = "hashing"
+
+    def __init__(self, dim=384):
+        self.dim = dim
+
+    def embed(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        words = [w for w in TOKEN_PATTERN.findall(text.lower()) if w not in STOPWORDS]
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        for feature in features:
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dim
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class Embed4AllEmbedder:
+    """Small CPU sentence-embedding model shipped with gpt4all (all-MiniLM-L6-v2)"""
+
+    name = "embed4all"
+
+    def __init__(self, allow_download=True):
+        from gpt4all import Embed4All
+        self.model = Embed4All(allow_download=allow_download)
+        self.dim = len(self.model.embed("probe"))
+
+    def embed(self, text):
+        vector = np.asarray(self.model.embed(text), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+def make_embedder(prefer="auto"):
+    """Return the Embed4All model when available (or requested), else the hashing embedder
+
+    "auto" only uses a model file that is already downloaded, so an offline
+    install starts without network access; "embed4all" may download it.
+    """
+    if prefer in ("auto", "embed4all"):
+        try:
+            return Embed4AllEmbedder(allow_download=prefer == "embed4all")
+        except Exception as e:
+            level = logging.WARNING if prefer == "embed4all" else logging.INFO
+            logging.getLogger(__name__).log(level, f"Embed4All unavailable, using hashing embedder: {e}")
+    return HashingEmbedder()
+
+
+class VectorMemoryIndex:
+    """Incremental cosine-similarity index over memory snippets
+
+    Search is a flat matrix-vector product until ``ivf_threshold`` entries;
+    beyond that a small k-means IVF index is (re)built on a background
+    thread, flat search serving until it is ready, and only the ``nprobe``
+    nearest lists are scanned. Vectors are appended to ``<path>.f32`` (raw
+    float32 rows, described by ``<path>.json``) and snippets to
+    ``<path>.jsonl``; a save writes only rows added since the last one.
+    """
+
+    SCAN_CHUNK = 8192  # rows scored between latency-budget checks
+
+    def __init__(self, path, embedder, ivf_threshold=4096, nlist=64, nprobe=6, save_every=20):
+        self.path = path
+        self.embedder = embedder
+        self.ivf_threshold = ivf_threshold
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.save_every = save_every
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._vectors = np.zeros((0, embedder.dim), dtype=np.float32)
+        self._count = 0
+        self._entries = []
+        self._seen = set()
+        self._unsaved = 0
+        self._saved = 0          # rows already on disk
+        self._rewrite = False    # on-disk files must be rewritten (migration, re-embedding, repair)
+        self._centroids = None
+        self._lists = None
+        self._ivf_size = 0
+        self._ivf_building = False
+        self.load()
+
+    def __len__(self):
+        return self._count
+
+    def add(self, text, kind="turn", **meta):
+        """Embed and insert one snippet; duplicates are ignored"""
+        text = text.strip()
+        key = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        if not text or key in self._seen:
+            return False
+        vector = self.embedder.embed(text)
+        with self._lock:
+            if key in self._seen:
+                return False
+            if self._count == len(self._vectors):
+                # Rows below _count are never modified, so readers holding the old array stay valid
+                grown = np.zeros((max(64, len(self._vectors) * 2), self._vectors.shape[1]), dtype=np.float32)
+                grown[:self._count] = self._vectors[:self._count]
+                self._vectors = grown
+            self._vectors[self._count] = vector
+            if self._lists is not None:
+                # Route new vectors into the existing IVF lists until the next rebuild
+                nearest = int(np.argmax(self._centroids @ vector))
+                self._lists[nearest].append(self._count)
+            self._count += 1
+            self._entries.append(dict(meta, text=text, kind=kind, time=time.time()))
+            self._seen.add(key)
+            self._unsaved += 1
+            save_now = self._unsaved >= self.save_every
+        if save_now:
+            self.save()
+        return True
+
+    def search(self, query, k=3, budget_ms=50.0, min_score=0.2):
+        """Top-k snippets as (score, entry), stopping early once the latency budget is spent"""
+        deadline = time.perf_counter() + budget_ms / 1000.0
+        if not self._count or not query.strip():
+            return []
+        vector = self.embedder.embed(query)
+        with self._lock:
+            count = self._count
+            vectors = self._vectors[:count]
+            if count >= self.ivf_threshold:
+                self._maybe_build_ivf(count)
+            lists = self._lists
+            centroids = self._centroids
+            entries = self._entries
+
+        # Score in chunks (newest rows / nearest lists first) and stop when the budget runs out
+        if lists is None:
+            groups = (np.arange(max(0, stop - self.SCAN_CHUNK), stop)
+                      for stop in range(count, 0, -self.SCAN_CHUNK))
+        else:
+            order = np.argsort(centroids @ vector)[::-1][:self.nprobe]
+            groups = (np.fromiter((i for i in lists[list_index] if i < count), dtype=np.int64)
+                      for list_index in order)
+        candidates, scores = [], []
+        for group in groups:
+            candidates.append(group)
+            scores.append(vectors[group] @ vector)
+            if time.perf_counter() > deadline:
+                break
+        candidates = np.concatenate(candidates) if candidates else np.zeros(0, dtype=np.int64)
+        if not len(candidates):
+            return []
+        scores = np.concatenate(scores)
+        top = min(k, len(candidates))
+        best = np.argpartition(-scores, top - 1)[:top]
+        best = best[np.argsort(-scores[best])]
+        return [(float(scores[i]), entries[candidates[i]]) for i in best if scores[i] >= min_score]
+
+    def _maybe_build_ivf(self, count):
+        """Start a background IVF build when the index has doubled since the last one (lock held)"""
+        if self._ivf_building or (self._lists is not None and count < self._ivf_size * 2):
+            return
+        self._ivf_building = True
+        threading.Thread(target=self._build_ivf, args=(self._vectors[:count], count),
+                         name="memory-ivf", daemon=True).start()
+
+    def _build_ivf(self, vectors, count, iterations=8):
+        """k-means over the first ``count`` vectors, then swap the lists in"""
+        try:
+            nlist = min(self.nlist, count)
+            rng = np.random.default_rng(0)
+            centroids = vectors[rng.choice(count, nlist, replace=False)].copy()
+            for _ in range(iterations):
+                assignment = np.argmax(vectors @ centroids.T, axis=1)
+                for c in range(nlist):
+                    members = vectors[assignment == c]
+                    if len(members):
+                        centroid = members.mean(axis=0)
+                        norm = np.linalg.norm(centroid)
+                        centroids[c] = centroid / norm if norm else centroid
+            assignment = np.argmax(vectors @ centroids.T, axis=1)
+            lists = [list(np.flatnonzero(assignment == c)) for c in range(nlist)]
+            with self._lock:
+                # Rows added while building go to their nearest list
+                for index in range(count, self._count):
+                    lists[int(np.argmax(centroids @ self._vectors[index]))].append(index)
+                self._lists = lists
+                self._centroids = centroids
+                self._ivf_size = count
+            self.logger.info(f"Built IVF memory index: {count} vectors in {nlist} lists")
+        except Exception as e:
+            self.logger.error(f"Error building IVF memory index: {e}")
+        finally:
+            with self._lock:
+                self._ivf_building = False
+
+    def save(self):
+        """Append rows added since the last save (or rewrite the files when they need it)"""
+        with self._save_lock:
+            with self._lock:
+                rewrite = self._rewrite or not self._saved  # nothing on disk yet: write the header too
+                start = 0 if rewrite else self._saved
+                count = self._count
+                vectors = self._vectors[start:count].copy()
+                entries = self._entries[start:count]
+                self._unsaved = 0
+            if not rewrite and not len(entries):
+                return
+            try:
+                directory = os.path.dirname(os.path.abspath(self.path))
+                os.makedirs(directory, exist_ok=True)
+                mode = "w" if rewrite else "a"
+                if rewrite:
+                    with open(self.path + ".json", "w", encoding="utf-8") as f:
+                        json.dump({"embedder": self.embedder.name, "dim": self.embedder.dim}, f)
+                # Vectors first: on load, snippets without a vector are re-embedded
+                with open(self.path + ".f32", mode + "b") as f:
+                    f.write(vectors.astype(np.float32).tobytes())
+                with open(self.path + ".jsonl", mode, encoding="utf-8") as f:
+                    for entry in entries:
+                        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                if rewrite and os.path.exists(self.path + ".npz"):
+                    os.remove(self.path + ".npz")  # superseded pre-append format
+                with self._lock:
+                    self._saved = count
+                    self._rewrite = False
+            except Exception as e:
+                self.logger.error(f"Error saving vector memory: {e}")
+                with self._lock:
+                    self._rewrite = True  # the files may be partly written; start over next time
+
+    def load(self):
+        if not os.path.exists(self.path + ".jsonl"):
+            return
+        vectors, embedder = None, None
+        try:
+            with open(self.path + ".jsonl", "r", encoding="utf-8") as f:
+                entries = []
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        break  # torn final line from an interrupted append
+            if os.path.exists(self.path + ".f32") and os.path.exists(self.path + ".json"):
+                with open(self.path + ".json", "r", encoding="utf-8") as f:
+                    header = json.load(f)
+                embedder = header["embedder"]
+                raw = np.fromfile(self.path + ".f32", dtype=np.float32)
+                dim = int(header["dim"])
+                vectors = raw[:len(raw) // dim * dim].reshape(-1, dim)
+            elif os.path.exists(self.path + ".npz"):
+                with np.load(self.path + ".npz") as data:
+                    vectors = data["vectors"].astype(np.float32)
+                    embedder = str(data["embedder"])
+                self._rewrite = True  # migrate to the append-only files on the next save
+        except Exception as e:
+            self.logger.error(f"Error loading vector memory: {e}")
+            return
+        if vectors is None or embedder != self.embedder.name or vectors.shape[1] != self.embedder.dim:
+            # Vectors from a different model are not comparable; re-embed the snippets
+            self.logger.info(f"Re-embedding {len(entries)} memories with {self.embedder.name}")
+            vectors = np.zeros((0, self.embedder.dim), dtype=np.float32)
+            self._rewrite = True
+        if len(vectors) != len(entries):
+            # An interrupted save: drop orphan vectors, embed snippets that lack one
+            vectors = vectors[:len(entries)]
+            missing = [self.embedder.embed(e["text"]) for e in entries[len(vectors):]]
+            if missing:
+                vectors = np.concatenate([vectors, np.stack(missing)])
+            self._rewrite = True
+        self._vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self._count = len(vectors)
+        self._entries = entries
+        self._saved = 0 if self._rewrite else self._count
+        self._unsaved = self._count - self._saved
+        self._seen = {hashlib.sha1(e["text"].encode("utf-8")).hexdigest() for e in entries}
+
+    def seed_from_memory(self, memory):
+        """Index memory entries: session 'recent' inputs and MemoryManager topics/personal details"""
+        for text in memory.get("recent", []):
+            self.add(f"The user once said: {text}", kind="recent")
+        for entry in memory.get("important_topics", []):
+            self.add(f"An important topic for the user: {entry['topic']}", kind="topic")
+        for category, values in memory.get("personal_details", {}).items():
+            if isinstance(values, dict):
+                for name, value in values.items():
+                    self.add(f"User {category}: {name} ({value})", kind="detail")
+            else:
+                for value in values:
+                    self.add(f"User {category}: {value}", kind="detail")
@@ -0,0 +1,227 @@
+"""
+Performance metrics for Local AI Companion
+Records per-turn latency and throughput (queue wait, prompt evaluation,
+time to first token, generation tokens/sec, TTS synthesis, playback start),
+keeps a window of recent turns for live display, and exports them as JSONL
+and Prometheus text
+"""
+
+import collections
+import json
+import logging
+import math
+import os
+import threading
+import time
+from datetime import datetime
+
+DEFAULT_WINDOW = 200  # recent turns kept for quantiles and the stats panel
+
+# (field, metric name, help, scale to base unit)
+SUMMARIES = (
+    ("queue_wait_ms", "carmen_queue_wait_seconds", "Time a turn waited before generation started", 0.001),
+    ("prompt_eval_ms", "carmen_prompt_eval_seconds", "Prompt evaluation time", 0.001),
+    ("ttft_ms", "carmen_time_to_first_token_seconds", "Request to first generated token", 0.001),
+    ("gen_tokens_per_s", "carmen_generation_tokens_per_second", "Decode speed after the first token", 1.0),
+    ("tts_ms", "carmen_tts_synthesis_seconds", "Text-to-speech synthesis time", 0.001),
+    ("playback_start_ms", "carmen_playback_start_seconds", "Request to start of audio playback", 0.001),
+)
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def _ms(start, end):
+    return round((end - start) * 1000, 1) if start is not None and end is not None else None
+
+
+def quantile(values, q):
+    """Nearest-rank quantile of a sorted list"""
+    if not values:
+        return None
+    return values[max(0, math.ceil(q * len(values)) - 1)]
+
+
+def prometheus_gauge(name, value, help_text):
+    return f"# HELP {name} {help_text}\n# TYPE {name} gauge\n{name} {value}\n"
+
+
+class Turn:
+    """Timestamps and counts for one exchange (times from time.perf_counter)
+
+    The thread handling each stage calls the matching method; stages that
+    never happen (no TTS, a backend that can't count prompt tokens) are
+    left out of the exported record.
+    """
+
+    def __init__(self, source="gui", session=None):
+        self.source = source
+        self.session = session
+        self.timestamp = datetime.now().isoformat()
+        self.created = time.perf_counter()
+        self.started = None
+        self.first_token = None
+        self.finished = None
+        self.prompt_tokens = None
+        self.prompt_eval_ms = None
+        self.generated_tokens = 0
+        self.tts_started = None
+        self.tts_finished = None
+        self.playback = None
+        self.error = None
+
+    def begin(self):
+        """Generation left the queue and started"""
+        self.started = time.perf_counter()
+
+    def prompt_evaluated(self, tokens, eval_ms=None):
+        """Reported by backends that know the prompt size and prefill time"""
+        self.prompt_tokens = tokens
+        self.prompt_eval_ms = round(eval_ms, 1) if eval_ms is not None else None
+
+    def token(self, count=1):
+        if self.first_token is None:
+            self.first_token = time.perf_counter()
+        self.generated_tokens += count
+
+    def generation_done(self, error=None):
+        self.finished = time.perf_counter()
+        if error is not None:
+            self.error = str(error)
+
+    def tts_begin(self):
+        self.tts_started = time.perf_counter()
+
+    def tts_done(self):
+        self.tts_finished = time.perf_counter()
+
+    def playback_started(self):
+        if self.playback is None:
+            self.playback = time.perf_counter()
+
+    def to_dict(self):
+        prompt_eval_ms = self.prompt_eval_ms
+        if prompt_eval_ms is None:
+            # Without backend timings, start-to-first-token is dominated by prompt evaluation
+            prompt_eval_ms = _ms(self.started, self.first_token)
+        tokens_per_s = None
+        if self.generated_tokens > 1 and self.finished and self.finished > self.first_token:
+            tokens_per_s = round((self.generated_tokens - 1) / (self.finished - self.first_token), 2)
+        record = {
+            "timestamp": self.timestamp,
+            "source": self.source,
+            "session": self.session,
+            "queue_wait_ms": _ms(self.created, self.started),
+            "prompt_tokens": self.prompt_tokens,
+            "prompt_eval_ms": prompt_eval_ms,
+            "ttft_ms": _ms(self.created, self.first_token),
+            "generated_tokens": self.generated_tokens,
+            "gen_tokens_per_s": tokens_per_s,
+            "total_ms": _ms(self.created, self.finished),
+            "tts_ms": _ms(self.tts_started, self.tts_finished),
+            "playback_start_ms": _ms(self.created, self.playback),
+            "error": self.error,
+        }
+        return {key: value for key, value in record.items() if value is not None}
+
+
+class PerfMetrics:
+    """Collects finished turns: a recent window, running totals and a JSONL log
+
+    Subscribers are called as ``callback(record)`` from the recording
+    thread after each turn.
+    """
+
+    def __init__(self, jsonl_path=None, window=DEFAULT_WINDOW):
+        self.jsonl_path = jsonl_path
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._recent = collections.deque(maxlen=window)
+        self._subscribers = []
+        self._file = None
+        self.turns = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.generated_tokens = 0
+        self._sums = collections.Counter()
+        self._counts = collections.Counter()
+        if jsonl_path:
+            os.makedirs(os.path.dirname(os.path.abspath(jsonl_path)), exist_ok=True)
+            self._file = open(jsonl_path, "a", encoding="utf-8")
+
+    def start_turn(self, source="gui", session=None):
+        return Turn(source, session)
+
+    def subscribe(self, callback):
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def record(self, turn):
+        """Add a finished turn; returns its exported record"""
+        record = turn.to_dict()
+        with self._lock:
+            self._recent.append(record)
+            self.turns += 1
+            self.errors += 1 if "error" in record else 0
+            self.prompt_tokens += record.get("prompt_tokens", 0)
+            self.generated_tokens += record.get("generated_tokens", 0)
+            for field, _, _, _ in SUMMARIES:
+                if field in record:
+                    self._sums[field] += record[field]
+                    self._counts[field] += 1
+            if self._file:
+                try:
+                    self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    self._file.flush()
+                except Exception as e:
+                    self.logger.error(f"Error writing perf metrics: {e}")
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(record)
+            except Exception as e:
+                self.logger.error(f"Perf metrics subscriber failed: {e}")
+        return record
+
+    def recent(self, n=20):
+        with self._lock:
+            return list(self._recent)[-n:]
+
+    def summary(self):
+        """Median and p90 of each metric over the recent window"""
+        with self._lock:
+            records = list(self._recent)
+        result = {"turns": len(records)}
+        for field, _, _, _ in SUMMARIES:
+            values = sorted(r[field] for r in records if field in r)
+            if values:
+                result[field] = {"p50": quantile(values, 0.5), "p90": quantile(values, 0.9)}
+        return result
+
+    def prometheus(self):
+        """Prometheus text exposition: counters plus summaries (quantiles over the recent window)"""
+        with self._lock:
+            records = list(self._recent)
+            counters = (
+                ("carmen_turns_total", "Completed turns", self.turns),
+                ("carmen_turn_errors_total", "Turns whose generation failed", self.errors),
+                ("carmen_prompt_tokens_total", "Prompt tokens evaluated", self.prompt_tokens),
+                ("carmen_generated_tokens_total", "Tokens generated", self.generated_tokens),
+            )
+            sums, counts = dict(self._sums), dict(self._counts)
+        lines = []
+        for name, help_text, value in counters:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter", f"{name} {value}"]
+        for field, name, help_text, scale in SUMMARIES:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} summary"]
+            values = sorted(r[field] for r in records if field in r)
+            for q in QUANTILES:
+                value = quantile(values, q)
+                lines.append(f'{name}{{quantile="{q}"}} {f"{value * scale:.6g}" if value is not None else "NaN"}')
+            lines.append(f"{name}_sum {sums.get(field, 0) * scale:.6g}")
+            lines.append(f"{name}_count {counts.get(field, 0)}")
+        return "\n".join(lines) + "\n"
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
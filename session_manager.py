@@ -0,0 +1,260 @@
+"""
+Multi-session support for Local AI Companion
+Hosts many users in one process: each session has its own memory, chat
+history, vector memory and mood under data/sessions/<user>, while one
+model instance is shared through a fair round-robin generation scheduler
+"""
+
+import collections
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future
+
+from chat_history import ChatHistoryLog
+from config_manager import UI_STATE_SCHEMA, get_config, release_config
+from memory_manager import MemoryManager
+from memory_vectors import VectorMemoryIndex, make_embedder
+
+SESSIONS_DIR = "data/sessions"
+DEFAULT_USER = "default"
+DEFAULT_MOOD = "Supportive"
+
+
+def safe_user_id(user_id):
+    """Map a client-supplied user name to a unique, filesystem-safe session id
+
+    A readable sanitised prefix plus a hash of the exact name, so names that
+    sanitise alike ("a b", "a_b") or differ only in case get separate
+    directories even on case-insensitive filesystems.
+    """
+    name = str(user_id or "").strip() or DEFAULT_USER
+    prefix = re.sub(r"[^A-Za-z0-9_-]", "_", name)[:32].lower()
+    digest = hashlib.blake2b(name.encode("utf-8"), digest_size=6).hexdigest()
+    return f"{prefix}-{digest}"
+
+
+class Session:
+    """One user's memory, chat history, vector memory and mood"""
+
+    def __init__(self, user_id, directory, embedder, name=None):
+        self.user_id = user_id
+        self.name = name or user_id
+        self.directory = directory
+        self.leases = 0  # open connections/requests using the session; never evicted while > 0
+        os.makedirs(directory, exist_ok=True)
+        self.memory = MemoryManager(os.path.join(directory, "memory.json"), write_behind=True)
+        self.history = ChatHistoryLog(os.path.join(directory, "chat.jsonl"))
+        self.vector_memory = VectorMemoryIndex(os.path.join(directory, "memory_vectors"), embedder)
+        self.state = get_config(os.path.join(directory, "state.json"),
+                                defaults={"last_mood": DEFAULT_MOOD}, schema=UI_STATE_SCHEMA)
+        self.last_active = time.monotonic()
+
+    @property
+    def mood(self):
+        return self.state.get("last_mood", DEFAULT_MOOD)
+
+    @mood.setter
+    def mood(self, value):
+        self.state["last_mood"] = value
+
+    def touch(self):
+        self.last_active = time.monotonic()
+
+    def close(self):
+        self.vector_memory.save()
+        self.memory.close()
+        self.history.close()
+        release_config(self.state.path)
+
+
+class FairScheduler:
+    """Runs generation jobs for the shared model on ``workers`` threads
+
+    Each session has its own FIFO; a free worker takes one job from the
+    next session in round-robin order, so a user with many queued requests
+    cannot starve the others, and a session never has more than one job
+    running. ``max_pending`` bounds each session's queue. Use more than one
+    worker only with a backend that batches concurrent generations.
+    """
+
+    def __init__(self, max_pending=4, workers=1):
+        self.max_pending = max_pending
+        self.logger = logging.getLogger(__name__)
+        self._queues = {}
+        self._rotation = collections.deque()
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._running = set()
+        self.completed = 0
+        self._threads = [
+            threading.Thread(target=self._run, name=f"generation-scheduler-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, session_id, job):
+        """Queue ``job()`` for ``session_id``; returns a Future with its result"""
+        future = Future()
+        with self._condition:
+            if self._stopped:
+                raise RuntimeError("scheduler is stopped")
+            queue = self._queues.setdefault(session_id, collections.deque())
+            if len(queue) >= self.max_pending:
+                raise RuntimeError(f"too many pending requests for session '{session_id}'")
+            queue.append((job, future))
+            if session_id not in self._rotation and session_id not in self._running:
+                self._rotation.append(session_id)
+            self._condition.notify()
+        return future
+
+    def stats(self):
+        with self._condition:
+            return {
+                "running": sorted(self._running),
+                "waiting": {sid: len(q) for sid, q in self._queues.items() if q},
+                "completed": self.completed,
+            }
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join(5.0)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._rotation and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    for queue in self._queues.values():
+                        while queue:
+                            queue.popleft()[1].cancel()
+                    return
+                session_id = self._rotation.popleft()
+                job, future = self._queues[session_id].popleft()
+                self._running.add(session_id)
+
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(job())
+                except Exception as e:
+                    future.set_exception(e)
+
+            with self._condition:
+                self._running.discard(session_id)
+                self.completed += 1
+                if self._queues[session_id]:
+                    self._rotation.append(session_id)  # back of the line behind everyone else
+                else:
+                    del self._queues[session_id]
+
+
+class SessionManager:
+    """Open sessions by user id, sharing one embedder and one scheduler
+
+    Sessions are loaded on first use and closed after ``idle_timeout``
+    seconds without activity (see ``close_idle``). Callers that keep a
+    session across calls (a request, a WebSocket message, a queued job)
+    hold it with ``acquire``/``release`` so the idle sweep leaves it open.
+    """
+
+    def __init__(self, root=SESSIONS_DIR, embedder=None, idle_timeout=1800, max_pending=4, workers=1):
+        self.root = root
+        self.embedder = embedder or make_embedder()
+        self.idle_timeout = idle_timeout
+        self.scheduler = FairScheduler(max_pending=max_pending, workers=workers)
+        self.logger = logging.getLogger(__name__)
+        # key -> Future of the Session, so a slow load only blocks callers for that key
+        self._sessions = {}
+        # key -> Future set once a closing session has flushed, so it is not reopened too early
+        self._closing = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        return self._open(user_id, lease=False)
+
+    def acquire(self, user_id):
+        """Like get(), but pinned open until release(); may block on disk, so not for the event loop"""
+        return self._open(user_id, lease=True)
+
+    def release(self, session):
+        with self._lock:
+            session.leases -= 1
+        session.touch()
+
+    def _open(self, user_id, lease):
+        name = str(user_id or "").strip() or DEFAULT_USER
+        key = safe_user_id(name)
+        while True:
+            build = False
+            with self._lock:
+                pending = self._closing.get(key)
+                if pending is None:
+                    pending = self._sessions.get(key)
+                    if pending is None:
+                        pending = self._sessions[key] = Future()
+                        build = True
+                    elif pending.done():
+                        session = pending.result()
+                        if lease:
+                            session.leases += 1
+                        session.touch()
+                        return session
+            if not build:
+                pending.result()  # wait for the load or close in progress, then look again
+                continue
+            # Loading memory and vectors can take a while: do it outside the lock
+            try:
+                session = Session(key, os.path.join(self.root, key), self.embedder, name)
+            except BaseException as e:
+                with self._lock:
+                    del self._sessions[key]
+                pending.set_exception(e)
+                raise
+            pending.set_result(session)
+            self.logger.info(f"Opened session '{key}' ({len(self._sessions)} active)")
+
+    def active(self):
+        with self._lock:
+            return list(self._sessions)
+
+    def close_idle(self):
+        """Close sessions idle for longer than idle_timeout; returns how many were closed"""
+        cutoff = time.monotonic() - self.idle_timeout
+        with self._lock:
+            idle = [f.result() for f in self._sessions.values()
+                    if f.done() and f.result().last_active < cutoff and not f.result().leases]
+            for session in idle:
+                del self._sessions[session.user_id]
+                self._closing[session.user_id] = Future()
+        for session in idle:
+            try:
+                session.close()
+            except Exception as e:
+                self.logger.error(f"Error closing session '{session.user_id}': {e}")
+            finally:
+                with self._lock:
+                    closed = self._closing.pop(session.user_id)
+                closed.set_result(None)
+        if idle:
+            self.logger.info(f"Closed {len(idle)} idle sessions")
+        return len(idle)
+
+    def close(self):
+        self.scheduler.stop()
+        with self._lock:
+            pending = list(self._sessions.values())
+            self._sessions.clear()
+        for future in pending:
+            try:
+                session = future.result()
+            except Exception:
+                continue  # its load failed and was already reported to the caller
+            session.close()
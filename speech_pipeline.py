@@ -0,0 +1,172 @@
+"""
+Pipeline utilities for Local AI Companion
+Bounded worker stages with explicit drop/coalesce backpressure and per-stage metrics
+"""
+
+import collections
+import logging
+import threading
+import time
+
+# Backpressure policies applied when a stage's queue is full
+DROP_OLDEST = "drop_oldest"    # discard the oldest pending item to make room
+DROP_NEWEST = "drop_newest"    # reject the incoming item
+COALESCE = "coalesce"          # merge the incoming item into the newest pending one
+
+
+class StageMetrics:
+    """Latency and queue-depth counters for one pipeline stage"""
+
+    def __init__(self, name, window=200):
+        self.name = name
+        self.lock = threading.Lock()
+        self.accepted = 0
+        self.processed = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.max_depth = 0
+        self.wait_times = collections.deque(maxlen=window)
+        self.service_times = collections.deque(maxlen=window)
+
+    def record_depth(self, depth):
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def record_done(self, wait, service, ok=True):
+        with self.lock:
+            self.processed += 1
+            if not ok:
+                self.errors += 1
+            self.wait_times.append(wait)
+            self.service_times.append(service)
+
+    def snapshot(self, depth=0):
+        """Return a plain dict of the current counters and latency percentiles"""
+        with self.lock:
+            waits = sorted(self.wait_times)
+            services = sorted(self.service_times)
+            return {
+                "stage": self.name,
+                "depth": depth,
+                "max_depth": self.max_depth,
+                "accepted": self.accepted,
+                "processed": self.processed,
+                "dropped": self.dropped,
+                "coalesced": self.coalesced,
+                "errors": self.errors,
+                "wait_p50_ms": _percentile(waits, 0.50) * 1000,
+                "wait_p95_ms": _percentile(waits, 0.95) * 1000,
+                "service_p50_ms": _percentile(services, 0.50) * 1000,
+                "service_p95_ms": _percentile(services, 0.95) * 1000,
+            }
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class BoundedStage:
+    """A single worker thread fed by a bounded queue
+
+    ``handler(item)`` runs on the stage thread. If it returns something other
+    than None and ``output`` is set, the result is pushed into the next stage.
+    ``put`` never blocks, so it is safe to call from audio callbacks.
+    """
+
+    def __init__(self, name, handler, maxsize=8, policy=DROP_OLDEST, merge=None, output=None):
+        if policy == COALESCE and merge is None:
+            raise ValueError(f"Stage '{name}' uses coalesce policy but has no merge function")
+        self.name = name
+        self.handler = handler
+        self.maxsize = maxsize
+        self.policy = policy
+        self.merge = merge
+        self.output = output
+        self.metrics = StageMetrics(name)
+        self.logger = logging.getLogger(__name__)
+        self._items = collections.deque()
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def put(self, item):
+        """Enqueue an item, applying the backpressure policy. Returns False if it was dropped."""
+        now = time.perf_counter()
+        with self._cond:
+            if len(self._items) >= self.maxsize:
+                if self.policy == DROP_NEWEST:
+                    self.metrics.dropped += 1
+                    return False
+                if self.policy == COALESCE:
+                    pending, enqueued_at = self._items[-1]
+                    self._items[-1] = (self.merge(pending, item), enqueued_at)
+                    self.metrics.coalesced += 1
+                    return True
+                self._items.popleft()
+                self.metrics.dropped += 1
+            self._items.append((item, now))
+            self.metrics.accepted += 1
+            self.metrics.record_depth(len(self._items))
+            self._cond.notify()
+        return True
+
+    def depth(self):
+        with self._cond:
+            return len(self._items)
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=f"stage-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=1.0):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and not self._items:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                item, enqueued_at = self._items.popleft()
+            started = time.perf_counter()
+            ok = True
+            result = None
+            try:
+                result = self.handler(item)
+            except Exception as e:
+                ok = False
+                self.logger.error(f"Stage '{self.name}' failed: {e}")
+            finished = time.perf_counter()
+            self.metrics.record_done(started - enqueued_at, finished - started, ok)
+            if ok and result is not None and self.output is not None:
+                self.output.put(result)
+
+    def snapshot(self):
+        return self.metrics.snapshot(self.depth())
+
+
+def format_metrics(stages):
+    """Render stage metrics as a small text table"""
+    lines = [f"{'stage':<12}{'depth':>7}{'max':>6}{'done':>7}{'drop':>6}{'merge':>7}"
+             f"{'wait p50/p95 ms':>18}{'work p50/p95 ms':>18}"]
+    for stage in stages:
+        m = stage.snapshot()
+        lines.append(
+            f"{m['stage']:<12}{m['depth']:>7}{m['max_depth']:>6}{m['processed']:>7}"
+            f"{m['dropped']:>6}{m['coalesced']:>7}"
+            f"{m['wait_p50_ms']:>9.1f}/{m['wait_p95_ms']:<8.1f}"
+            f"{m['service_p50_ms']:>9.1f}/{m['service_p95_ms']:<8.1f}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,106 @@
+"""
+Tk UI utilities for Local AI Companion
+"""
+
+import collections
+import threading
+import tkinter as tk
+
+
+def trim_text_widget(widget, max_lines, slack=None):
+    """Delete the oldest lines of a Text widget once it holds more than max_lines
+
+    Trimming waits until ``slack`` extra lines (default 10%) have built up,
+    so the delete happens once per batch rather than on every insert. The
+    widget must be in the NORMAL state. Returns the number of lines removed.
+    """
+    if not max_lines:
+        return 0
+    slack = max(1, max_lines // 10) if slack is None else slack
+    lines = int(widget.index("end-1c").split(".")[0]) - 1
+    excess = lines - max_lines
+    if excess <= slack:
+        return 0
+    widget.delete("1.0", f"{excess + 1}.0")
+    return excess
+
+
+class UIUpdateQueue:
+    """Thread-safe queue of chat lines and UI callbacks, drained on the Tk thread
+
+    Worker threads call ``put_line``/``call`` which only touch a deque. A
+    single ``root.after`` pump drains it every ``interval_ms`` and writes
+    all consecutive pending lines to the chat widget with one insert and
+    one scroll, so bursts of output cost one widget update per tick. With
+    ``max_lines`` set, the oldest lines are trimmed from the widget.
+    """
+
+    def __init__(self, root, widget, interval_ms=50, max_lines=None):
+        self.root = root
+        self.widget = widget
+        self.interval_ms = interval_ms
+        self.max_lines = max_lines
+        self._items = collections.deque()
+        self._lock = threading.Lock()
+        self._after_id = None
+
+    def put_line(self, line):
+        with self._lock:
+            self._items.append((line, None, None))
+
+    def call(self, func, *args):
+        """Run ``func(*args)`` on the Tk thread, in order with queued lines"""
+        with self._lock:
+            self._items.append((None, func, args))
+
+    def clear_lines(self):
+        """Forget lines that have not been drawn yet (e.g. when the chat is cleared)"""
+        with self._lock:
+            self._items = collections.deque(item for item in self._items if item[0] is None)
+
+    def start(self):
+        if self._after_id is None:
+            self._after_id = self.root.after(self.interval_ms, self._pump)
+
+    def stop(self):
+        if self._after_id is not None:
+            try:
+                self.root.after_cancel(self._after_id)
+            except Exception:
+                pass
+            self._after_id = None
+
+    def flush(self):
+        """Drain everything now; must be called on the Tk thread"""
+        with self._lock:
+            items = self._items
+            self._items = collections.deque()
+
+        lines = []
+        for line, func, args in items:
+            if line is not None:
+                lines.append(line)
+                continue
+            self._write(lines)
+            lines = []
+            try:
+                func(*args)
+            except Exception as e:
+                print(f"UI update error: {e}")
+        self._write(lines)
+
+    def _pump(self):
+        self._after_id = None
+        try:
+            self.flush()
+        finally:
+            self._after_id = self.root.after(self.interval_ms, self._pump)
+
+    def _write(self, lines):
+        if not lines or self.widget is None:
+            return
+        self.widget.config(state=tk.NORMAL)
+        self.widget.insert(tk.END, "\n".join(lines) + "\n")
+        trim_text_widget(self.widget, self.max_lines)
+        self.widget.config(state=tk.DISABLED)
+        self.widget.see(tk.END)